@@ -0,0 +1,104 @@
+# admission.py
+
+import threading
+import time
+
+# --- Admission Control for the Scan Tier ---
+# Each gunicorn worker holds one AdmissionController. A scan is admitted only while the
+# in-flight budget (bytes of upload being parsed/scored, plus a cap on concurrent scans)
+# has room. Otherwise it waits in a bounded queue for at most `queue_timeout` seconds; when
+# the queue is full or the wait times out, the caller is told to answer 503 + Retry-After
+# right away instead of piling more work onto a saturated worker.
+
+MIN_REQUEST_WEIGHT = 64 * 1024  # Floor so tiny uploads still cost something
+
+
+class AdmissionController:
+    """
+    Weighted, bounded admission gate.
+
+    Args:
+        max_inflight_bytes (int): Total upload bytes allowed in flight at once.
+        max_inflight_requests (int): Maximum concurrent admitted scans, regardless of size.
+        max_queue (int): Maximum requests allowed to wait for budget; further requests are rejected immediately.
+        queue_timeout (float): Seconds a queued request waits before being rejected.
+        retry_after (int): Seconds suggested to rejected clients via the Retry-After header.
+    """
+
+    def __init__(self, max_inflight_bytes, max_inflight_requests, max_queue, queue_timeout, retry_after):
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_inflight_requests = max_inflight_requests
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._cond = threading.Condition()
+        self._inflight_bytes = 0
+        self._inflight_requests = 0
+        self._queued = 0
+        self._rejected = 0
+
+    def weigh(self, content_length):
+        """
+        Budget weight of a request: its upload size, clamped to [MIN_REQUEST_WEIGHT, max_inflight_bytes].
+        Uploads with no Content-Length (chunked) could be any size, so they are charged the whole budget.
+        """
+        if content_length is None:
+            return self.max_inflight_bytes
+        weight = max(content_length, MIN_REQUEST_WEIGHT)
+        # A single upload larger than the whole budget may still run, but only on its own.
+        return min(weight, self.max_inflight_bytes)
+
+    def _has_room(self, weight):
+        return (self._inflight_requests < self.max_inflight_requests
+                and self._inflight_bytes + weight <= self.max_inflight_bytes)
+
+    def try_acquire(self, weight):
+        """
+        Admits a request of `weight` bytes. Returns True when admitted, False when it must be shed.
+        A request that fits is admitted at once, even if larger ones are waiting: the queue only
+        holds requests that do not fit yet, so a small scan is never shed behind a full queue.
+        """
+        with self._cond:
+            if self._has_room(weight):
+                self._admit(weight)
+                return True
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                return False
+
+            self._queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while not self._has_room(weight):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        return False
+                    self._cond.wait(remaining)
+                self._admit(weight)
+                return True
+            finally:
+                self._queued -= 1
+
+    def _admit(self, weight):
+        self._inflight_bytes += weight
+        self._inflight_requests += 1
+
+    def release(self, weight):
+        with self._cond:
+            self._inflight_bytes -= weight
+            self._inflight_requests -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'inflightBytes': self._inflight_bytes,
+                'inflightRequests': self._inflight_requests,
+                'queued': self._queued,
+                'rejected': self._rejected,
+                'maxInflightBytes': self.max_inflight_bytes,
+                'maxInflightRequests': self.max_inflight_requests,
+                'maxQueue': self.max_queue,
+            }
@@ -13,9 +13,17 @@ import logging
 import datetime 
 import random 
 import shutil # For more robust directory removal
+import functools
+import hashlib
 
 # --- Custom Feature Extraction (for .exe files) ---
 from extract_features import extract_static_features
+# --- Volatility Plugin Output Aggregation (for memory dumps) ---
+from extract_memory_features import extract_memory_features, detect_plugin, missing_plugins, MemoryFeatureError, SUPPORTED_EXTENSIONS as MEMORY_PLUGIN_EXTENSIONS
+# --- Admission Control (backpressure for the scan tier) ---
+from admission import AdmissionController
+# --- Nearest-Known-Sample Index (optional, built by hybrid_training.py) ---
+from similarity_index import SimilarityIndex, ScanHistory, make_scoring_model
 
 app = Flask(__name__)
 CORS(app)
@@ -25,6 +33,22 @@ UPLOAD_FOLDER = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'exe', 'csv'}
 MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
 
+# Per-worker scan budget. Keep SCAN_MAX_INFLIGHT + SCAN_MAX_QUEUE below the gunicorn thread count
+# (see Procfile) so threads are always left for the lightweight lane (/api/admin/*, /health),
+# which bypasses admission.
+SCAN_MAX_INFLIGHT_MB = float(os.environ.get('SCAN_MAX_INFLIGHT_MB', 64))
+SCAN_MAX_INFLIGHT = int(os.environ.get('SCAN_MAX_INFLIGHT', 2))
+SCAN_MAX_QUEUE = int(os.environ.get('SCAN_MAX_QUEUE', 4))
+SCAN_QUEUE_TIMEOUT = float(os.environ.get('SCAN_QUEUE_TIMEOUT', 5))
+SCAN_RETRY_AFTER = int(os.environ.get('SCAN_RETRY_AFTER', 5))
+
+# Neighbours returned in 'similarSamples' for anomalies; clients can ask for any scan with ?neighbors=k.
+SIMILARITY_TOP_K = int(os.environ.get('SIMILARITY_TOP_K', 5))
+SIMILARITY_MAX_K = 50
+# Scan history is shared by all workers on the host through this SQLite file and capped at SCAN_HISTORY_MAX scans.
+SCAN_HISTORY_DB = os.environ.get('SCAN_HISTORY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_history.sqlite3"))
+SCAN_HISTORY_MAX = int(os.environ.get('SCAN_HISTORY_MAX', 10000))
+
 # --- Logging Setup ---
 # Ensure the root logger is configured to see logs from other modules if they use logging.
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -69,6 +93,51 @@ try:
 except Exception as e:
     logger.critical(f"❌ CRITICAL ERROR: Failed to load one or more model artifacts: {e}", exc_info=True)
 
+# The similarity index is optional: scans work without it, they just omit 'similarSamples'.
+# In the 'encoded' space, scoring_model replaces the plain autoencoder call and also returns the bottleneck.
+similarity_index, scoring_model, scan_history = None, None, None
+similarity_index_path = os.path.join(MODEL_DIR, "similarity_index.pkl")
+if MODELS_LOADED and os.path.exists(similarity_index_path):
+    try:
+        similarity_index = SimilarityIndex.load(similarity_index_path)
+        if similarity_index.space == 'encoded':
+            scoring_model = make_scoring_model(autoencoder)
+        scan_history = ScanHistory(SCAN_HISTORY_DB, dim=similarity_index.dim, max_entries=SCAN_HISTORY_MAX)
+        logger.info(f"✅ Similarity index loaded: {len(similarity_index)} samples ({similarity_index.space} space).")
+    except Exception as e:
+        similarity_index, scoring_model, scan_history = None, None, None
+        logger.error(f"Failed to load similarity index from {similarity_index_path}: {e}", exc_info=True)
+else:
+    logger.info("No similarity index found; scan responses will not include similar samples.")
+
+
+scan_admission = AdmissionController(
+    max_inflight_bytes=int(SCAN_MAX_INFLIGHT_MB * 1024 * 1024),
+    max_inflight_requests=SCAN_MAX_INFLIGHT,
+    max_queue=SCAN_MAX_QUEUE,
+    queue_timeout=SCAN_QUEUE_TIMEOUT,
+    retry_after=SCAN_RETRY_AFTER,
+)
+
+def admission_controlled(view):
+    """
+    Gates a scan route on the worker's in-flight budget, weighted by the declared upload size.
+    Runs before the request body is read, so shed requests cost neither parsing nor buffering.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        weight = scan_admission.weigh(request.content_length)
+        if not scan_admission.try_acquire(weight):
+            logger.warning(f"Scan rejected by admission control ({weight} bytes): {scan_admission.stats()}")
+            response = jsonify({'status': 'error', 'message': 'Scan service is at capacity. Please retry shortly.'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(scan_admission.retry_after)
+            return response
+        try:
+            return view(*args, **kwargs)
+        finally:
+            scan_admission.release(weight)
+    return wrapper
 
 def get_file_extension(filename):
     return filename.rsplit('.', 1)[1].lower() if '.' in filename else None
@@ -76,27 +145,240 @@ def get_file_extension(filename):
 def allowed_file(filename):
     return get_file_extension(filename) in ALLOWED_EXTENSIONS
 
+def file_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def combined_sha256(named_hashes):
+    """One content hash for a multi-file upload (e.g. a memory dump's plugin outputs), independent of upload order."""
+    sha256 = hashlib.sha256()
+    for name in sorted(named_hashes):
+        sha256.update(f"{name}:{named_hashes[name]}\n".encode())
+    return sha256.hexdigest()
+
+def check_scan_filename(filename):
+    """
+    Validates the name of the file uploaded to /scan (None when the "file" field is missing).
+    Returns (file_ext, None), or (None, (error_body, http_status)).
+    """
+    if filename is None:
+        logger.warning("Bad request: 'file' part missing from request.")
+        return None, ({'status': 'error', 'message': 'No file part in the request. Ensure the form field name is "file".'}, 400)
+    if filename == '':
+        logger.warning("Bad request: Empty filename provided.")
+        return None, ({'status': 'error', 'message': 'No selected file (empty filename)'}, 400)
+    file_ext = get_file_extension(filename)
+    if not file_ext or not allowed_file(filename):
+        logger.warning(f"Bad request: File type '{file_ext}' not allowed for '{filename}'.")
+        return None, ({'status': 'error', 'message': f'File type not allowed. Only {", ".join(ALLOWED_EXTENSIONS)} are supported.'}, 400)
+    return file_ext, None
+
+def match_memory_plugins(named_uploads):
+    """
+    Maps the plugin output files uploaded to /scan/memory, given as (filename, upload) pairs,
+    to their Volatility plugin. Returns ({plugin: upload}, None), or (None, (error_body, http_status)).
+    """
+    if not named_uploads:
+        logger.warning("Bad request: 'files' part missing from memory scan request.")
+        return None, ({'status': 'error', 'message': 'No plugin output files in the request. Ensure the form field name is "files".'}, 400)
+    plugin_uploads = {}
+    for upload_name, upload in named_uploads:
+        plugin = detect_plugin(upload_name)
+        if get_file_extension(upload_name) not in MEMORY_PLUGIN_EXTENSIONS or plugin is None:
+            logger.warning(f"Bad request: '{upload_name}' is not a recognised Volatility plugin output file.")
+            return None, ({'status': 'error', 'message': f"Could not identify the plugin output in '{upload_name}'. Name files after the plugin (e.g. handles.csv) and use one of: {', '.join(sorted(MEMORY_PLUGIN_EXTENSIONS))}."}, 400)
+        if plugin in plugin_uploads:
+            return None, ({'status': 'error', 'message': f"More than one output file supplied for plugin '{plugin}'."}, 400)
+        plugin_uploads[plugin] = upload
+    return plugin_uploads, None
+
+def load_csv_input(temp_file_path, filename):
+    """
+    Reads an uploaded feature CSV (model feature format, or the original training format with
+    label columns on either side) and returns (input_df, None), or (None, (error_body, http_status)).
+    """
+    logger.info(f"Processing .csv file: {filename}")
+    try:
+        df_from_csv = pd.read_csv(temp_file_path)
+        if df_from_csv.empty:
+            logger.error(f"Uploaded CSV '{filename}' is empty.")
+            return None, ({'status': 'error', 'message': 'Uploaded CSV file is empty.'}, 400)
+        df_row_to_process = df_from_csv.head(1)
+        if list(df_row_to_process.columns) == expected_feature_names:
+            logger.info(f"CSV '{filename}' matches expected feature format directly.")
+            return df_row_to_process, None
+        elif len(df_row_to_process.columns) == len(expected_feature_names) + 2:
+            logger.info(f"CSV '{filename}' appears to be in original training data format. Extracting middle columns for features.")
+            feature_values_from_original_format = df_row_to_process.iloc[:, 1:-1]
+            if len(feature_values_from_original_format.columns) == len(expected_feature_names):
+                feature_values_from_original_format.columns = expected_feature_names
+                return feature_values_from_original_format, None
+            else:
+                logger.error(f"CSV '{filename}' (original format) did not yield correct number of feature columns.")
+                return None, ({'status': 'error', 'message': 'CSV format (original type) error: Incorrect number of features after processing.'}, 400)
+        else:
+            logger.error(f"CSV '{filename}' column structure does not match expected formats. Columns found: {list(df_row_to_process.columns)}")
+            return None, ({'status': 'error', 'message': 'CSV column structure mismatch.'}, 400)
+    except Exception as e:
+        logger.error(f"Error reading or processing CSV '{filename}': {e}", exc_info=True)
+        return None, ({'status': 'error', 'message': f'Could not read or process CSV file: {str(e)}'}, 400)
+
+def predict_scan_result(input_df, filename, neighbors=None, content_hash=None):
+    """
+    Aligns a single-row feature DataFrame to the model's expected features and runs the hybrid
+    AE + RF model on it. Returns (response_body, http_status) so every ingestion route shares it.
+    `neighbors` overrides how many similar samples are attached (default: SIMILARITY_TOP_K for anomalies only).
+    `content_hash` identifies the upload in the scan history and is returned as "sha256";
+    without it the scan is not recorded.
+    """
+    logger.debug(f"Input DataFrame for '{filename}' before column alignment (head): \n{input_df.head()}") # ADDED LOG
+
+    try:
+        missing_input_cols = [col for col in expected_feature_names if col not in input_df.columns]
+        if missing_input_cols:
+            logger.error(f"Input DataFrame for '{filename}' is missing expected columns: {missing_input_cols}")
+            return {'status': 'error', 'message': f'Processed input is missing required feature columns: {", ".join(missing_input_cols)}.'}, 400
+        input_df = input_df[expected_feature_names] 
+        logger.debug(f"Input DataFrame for '{filename}' after column alignment (dtypes): \n{input_df.dtypes}") # ADDED LOG
+        logger.debug(f"Input DataFrame for '{filename}' NaN check: {input_df.isnull().sum().sum()} NaNs") # ADDED LOG
+
+    except KeyError as e:
+        logger.error(f"KeyError during DataFrame column alignment for '{filename}': {e}.", exc_info=True)
+        return {'status': 'error', 'message': f'Feature mismatch error: An expected feature ({str(e)}) was not found.'}, 500
+    except Exception as e:
+        logger.error(f"Error aligning DataFrame columns for '{filename}': {e}", exc_info=True)
+        return {'status': 'error', 'message': f'Internal error preparing features for model: {str(e)}'}, 500
+
+    try:
+        X_scaled = scaler.transform(input_df)
+        logger.debug(f"X_scaled for '{filename}' (sample): {X_scaled[0, :10] if X_scaled.shape[1] > 10 else X_scaled}") # ADDED LOG (sample)
+    except Exception as e:
+        logger.error(f"Error during feature scaling for '{filename}': {e}", exc_info=True)
+        logger.error(f"Data causing scaling error (first 5 rows, all columns): \n{input_df.head()}") # Log data before scaling
+        return {'status': 'error', 'message': f'Feature scaling error: {str(e)}'}, 500
+        
+    ae_is_malware = False
+    rf_prediction_label_from_model = "Error"
+    confidence_to_display = 0.0
+    final_type_label = "Error" 
+    risk_level = "Undetermined"
+    mse = -1.0
+    encoded = None
+
+    try:
+        if scoring_model is not None:
+            reconstructed, encoded = scoring_model.predict(X_scaled)
+        else:
+            reconstructed = autoencoder.predict(X_scaled)
+        mse = np.mean(np.square(X_scaled - reconstructed), axis=1)[0]
+        ae_is_malware = bool(mse > mse_threshold)
+        logger.info(f"AE for '{filename}': MSE={mse:.6f}, Threshold={mse_threshold:.6f}, AE_is_Malware={ae_is_malware}") # ADDED LOG
+
+        rf_pred_raw_idx_or_label = rf_model.predict(X_scaled)[0]
+        rf_proba_vector = rf_model.predict_proba(X_scaled)[0]
+        logger.debug(f"RF for '{filename}': Raw prediction={rf_pred_raw_idx_or_label}, Proba vector (first 5): {rf_proba_vector[:5]}") # ADDED LOG
+
+        if rf_classes is not None:
+            try:
+                if isinstance(rf_pred_raw_idx_or_label, (int, np.integer)) and 0 <= rf_pred_raw_idx_or_label < len(rf_classes):
+                    rf_prediction_label_from_model = rf_classes[rf_pred_raw_idx_or_label]
+                    rf_top_class_confidence = float(rf_proba_vector[rf_pred_raw_idx_or_label]) * 100
+                else: 
+                    rf_prediction_label_from_model = str(rf_pred_raw_idx_or_label)
+                    class_idx_for_confidence = list(rf_classes).index(rf_prediction_label_from_model)
+                    rf_top_class_confidence = float(rf_proba_vector[class_idx_for_confidence]) * 100
+            except (IndexError, ValueError) as map_err:
+                logger.warning(f"Could not reliably map RF prediction '{rf_pred_raw_idx_or_label}' to class name or get its direct probability: {map_err}. Using max probability as fallback.")
+                rf_prediction_label_from_model = str(rf_pred_raw_idx_or_label) 
+                rf_top_class_confidence = float(np.max(rf_proba_vector)) * 100
+        else: 
+            rf_prediction_label_from_model = str(rf_pred_raw_idx_or_label)
+            rf_top_class_confidence = float(np.max(rf_proba_vector)) * 100
+        
+        logger.info(f"RF for '{filename}': Predicted Label='{rf_prediction_label_from_model}', Top Confidence={rf_top_class_confidence:.2f}%") # ADDED LOG
+
+        if ae_is_malware: 
+            final_type_label = rf_prediction_label_from_model 
+            confidence_to_display = rf_top_class_confidence 
+            # if final_type_label == "Benign":
+            #     final_type_label = "Unknown/Anomaly"
+            
+            if "Ransomware" in final_type_label: risk_level = "Critical"
+            elif "Trojan" in final_type_label: risk_level = "High"
+            elif "Spyware" in final_type_label: risk_level = "Medium"
+            # elif final_type_label == "Unknown/Anomaly": risk_level = "High"
+            else: risk_level = "Medium" 
+        else: 
+            final_type_label = "Benign" 
+            risk_level = "Low"
+            if rf_classes is not None and "Benign" in rf_classes:
+                try:
+                    benign_class_idx = list(rf_classes).index("Benign")
+                    confidence_to_display = float(rf_proba_vector[benign_class_idx]) * 100
+                except (ValueError, IndexError):
+                    confidence_to_display = 99.0 
+            else: 
+                confidence_to_display = 99.0
+        logger.info(f"Hybrid Verdict for '{filename}': Final Type='{final_type_label}', Confidence Displayed={confidence_to_display:.2f}%, Risk='{risk_level}'") # ADDED LOG
+    except Exception as e:
+        logger.error(f"Error during model prediction for '{filename}': {e}", exc_info=True)
+
+    current_timestamp_obj = datetime.datetime.utcnow()
+
+    similar_samples = None
+    if similarity_index is not None and final_type_label != "Error":
+        k = neighbors if neighbors is not None else (SIMILARITY_TOP_K if ae_is_malware else 0)
+        try:
+            index_vector = encoded[0] if encoded is not None else X_scaled[0]
+            if k > 0:
+                k = min(k, SIMILARITY_MAX_K)
+                # Ground-truth training samples and model-labelled previous scans are ranked separately.
+                similar_samples = {
+                    "knownSamples": similarity_index.search(index_vector, k=k),
+                    "previousScans": scan_history.search(index_vector, k=k, exclude_hash=content_hash),
+                }
+            if content_hash is not None:
+                scan_history.add(content_hash, index_vector, final_type_label, filename, current_timestamp_obj.isoformat() + 'Z')
+        except Exception as e:
+            logger.warning(f"Similarity lookup failed for '{filename}': {e}", exc_info=True)
+
+    scan_result_data = {
+        "fileName": filename,
+        "scanTime": current_timestamp_obj.strftime('%Y-%m-%d %I:%M:%S %p UTC'),
+        "isMalware": ae_is_malware,
+        "malwareType": final_type_label,
+        "confidenceScore": round(confidence_to_display, 2),
+        "riskLevel": risk_level,
+        "aeVerdictOnExe": "Anomaly" if ae_is_malware else "Normal",
+        "rfRawPrediction": rf_prediction_label_from_model,
+        "aeReconstructionError": round(float(mse), 6),
+        "aeThreshold": round(float(mse_threshold), 6)
+    }
+    if content_hash is not None:
+        scan_result_data["sha256"] = content_hash
+    if similar_samples is not None:
+        scan_result_data["similarSamples"] = similar_samples
+    
+    logger.info(f"Dummy mode: Scan result for '{filename}' not saved to DB (Firestore disabled).")
+    logger.info(f"Final scan result for '{filename}': {scan_result_data}")
+    return scan_result_data, 200
+
 @app.route('/scan', methods=['POST'])
+@admission_controlled
 def scan_file_route():
     if not MODELS_LOADED:
         logger.error("Scan attempt failed: Models not loaded. Service unavailable.")
         return jsonify({'status': 'error', 'message': 'Service unavailable: Essential models are not loaded.'}), 503
 
-    if 'file' not in request.files:
-        logger.warning("Bad request: 'file' part missing from request.")
-        return jsonify({'status': 'error', 'message': 'No file part in the request. Ensure the form field name is "file".'}), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        logger.warning("Bad request: Empty filename provided.")
-        return jsonify({'status': 'error', 'message': 'No selected file (empty filename)'}), 400
-
-    filename = secure_filename(file.filename)
-    file_ext = get_file_extension(filename)
-
-    if not file_ext or not allowed_file(filename):
-        logger.warning(f"Bad request: File type '{file_ext}' not allowed for '{filename}'.")
-        return jsonify({'status': 'error', 'message': f'File type not allowed. Only {", ".join(ALLOWED_EXTENSIONS)} are supported.'}), 400
+    file = request.files.get('file')
+    filename = secure_filename(file.filename) if file is not None else None
+    file_ext, upload_error = check_scan_filename(filename)
+    if upload_error is not None:
+        error_body, status_code = upload_error
+        return jsonify(error_body), status_code
 
     request_temp_dir = None 
     temp_file_path = None   
@@ -105,6 +387,7 @@ def scan_file_route():
         request_temp_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER)
         temp_file_path = os.path.join(request_temp_dir, filename)
         file.save(temp_file_path)
+        content_hash = file_sha256(temp_file_path)
         logger.info(f"File '{filename}' (type: {file_ext}) temporarily saved to: {temp_file_path}")
 
         input_df = None
@@ -117,141 +400,17 @@ def scan_file_route():
                 return jsonify({'status': 'error', 'message': 'Failed to extract features from .exe (file might be corrupted or not a valid PE).'}), 500
             input_df = pd.DataFrame([raw_features_dict])
         elif file_ext == 'csv':
-            logger.info(f"Processing .csv file: {filename}")
-            try:
-                df_from_csv = pd.read_csv(temp_file_path)
-                if df_from_csv.empty:
-                    logger.error(f"Uploaded CSV '{filename}' is empty.")
-                    return jsonify({'status': 'error', 'message': 'Uploaded CSV file is empty.'}), 400
-                df_row_to_process = df_from_csv.head(1)
-                if list(df_row_to_process.columns) == expected_feature_names:
-                    logger.info(f"CSV '{filename}' matches expected feature format directly.")
-                    input_df = df_row_to_process
-                elif len(df_row_to_process.columns) == len(expected_feature_names) + 2:
-                    logger.info(f"CSV '{filename}' appears to be in original training data format. Extracting middle columns for features.")
-                    feature_values_from_original_format = df_row_to_process.iloc[:, 1:-1]
-                    if len(feature_values_from_original_format.columns) == len(expected_feature_names):
-                        feature_values_from_original_format.columns = expected_feature_names
-                        input_df = feature_values_from_original_format
-                    else:
-                        logger.error(f"CSV '{filename}' (original format) did not yield correct number of feature columns.")
-                        return jsonify({'status': 'error', 'message': 'CSV format (original type) error: Incorrect number of features after processing.'}), 400
-                else:
-                    logger.error(f"CSV '{filename}' column structure does not match expected formats. Columns found: {list(df_row_to_process.columns)}")
-                    return jsonify({'status': 'error', 'message': 'CSV column structure mismatch.'}), 400
-            except Exception as e:
-                logger.error(f"Error reading or processing CSV '{filename}': {e}", exc_info=True)
-                return jsonify({'status': 'error', 'message': f'Could not read or process CSV file: {str(e)}'}), 400
+            input_df, csv_error = load_csv_input(temp_file_path, filename)
+            if csv_error is not None:
+                error_body, status_code = csv_error
+                return jsonify(error_body), status_code
         
         if input_df is None:
              logger.critical(f"Internal error: input_df not populated for {filename}.")
              return jsonify({'status': 'error', 'message': 'Internal server error processing file input.'}), 500
-        
-        logger.debug(f"Input DataFrame for '{filename}' before column alignment (head): \n{input_df.head()}") # ADDED LOG
-
-        try:
-            missing_input_cols = [col for col in expected_feature_names if col not in input_df.columns]
-            if missing_input_cols:
-                logger.error(f"Input DataFrame for '{filename}' is missing expected columns: {missing_input_cols}")
-                return jsonify({'status': 'error', 'message': f'Processed input is missing required feature columns: {", ".join(missing_input_cols)}.'}), 400
-            input_df = input_df[expected_feature_names] 
-            logger.debug(f"Input DataFrame for '{filename}' after column alignment (dtypes): \n{input_df.dtypes}") # ADDED LOG
-            logger.debug(f"Input DataFrame for '{filename}' NaN check: {input_df.isnull().sum().sum()} NaNs") # ADDED LOG
-
-        except KeyError as e:
-            logger.error(f"KeyError during DataFrame column alignment for '{filename}': {e}.", exc_info=True)
-            return jsonify({'status': 'error', 'message': f'Feature mismatch error: An expected feature ({str(e)}) was not found.'}), 500
-        except Exception as e:
-            logger.error(f"Error aligning DataFrame columns for '{filename}': {e}", exc_info=True)
-            return jsonify({'status': 'error', 'message': f'Internal error preparing features for model: {str(e)}'}), 500
 
-        try:
-            X_scaled = scaler.transform(input_df)
-            logger.debug(f"X_scaled for '{filename}' (sample): {X_scaled[0, :10] if X_scaled.shape[1] > 10 else X_scaled}") # ADDED LOG (sample)
-        except Exception as e:
-            logger.error(f"Error during feature scaling for '{filename}': {e}", exc_info=True)
-            logger.error(f"Data causing scaling error (first 5 rows, all columns): \n{input_df.head()}") # Log data before scaling
-            return jsonify({'status': 'error', 'message': f'Feature scaling error: {str(e)}'}), 500
-            
-        ae_is_malware = False
-        rf_prediction_label_from_model = "Error"
-        confidence_to_display = 0.0
-        final_type_label = "Error" 
-        risk_level = "Undetermined"
-        mse = -1.0
-
-        try:
-            reconstructed = autoencoder.predict(X_scaled)
-            mse = np.mean(np.square(X_scaled - reconstructed), axis=1)[0]
-            ae_is_malware = bool(mse > mse_threshold)
-            logger.info(f"AE for '{filename}': MSE={mse:.6f}, Threshold={mse_threshold:.6f}, AE_is_Malware={ae_is_malware}") # ADDED LOG
-
-            rf_pred_raw_idx_or_label = rf_model.predict(X_scaled)[0]
-            rf_proba_vector = rf_model.predict_proba(X_scaled)[0]
-            logger.debug(f"RF for '{filename}': Raw prediction={rf_pred_raw_idx_or_label}, Proba vector (first 5): {rf_proba_vector[:5]}") # ADDED LOG
-
-            if rf_classes is not None:
-                try:
-                    if isinstance(rf_pred_raw_idx_or_label, (int, np.integer)) and 0 <= rf_pred_raw_idx_or_label < len(rf_classes):
-                        rf_prediction_label_from_model = rf_classes[rf_pred_raw_idx_or_label]
-                        rf_top_class_confidence = float(rf_proba_vector[rf_pred_raw_idx_or_label]) * 100
-                    else: 
-                        rf_prediction_label_from_model = str(rf_pred_raw_idx_or_label)
-                        class_idx_for_confidence = list(rf_classes).index(rf_prediction_label_from_model)
-                        rf_top_class_confidence = float(rf_proba_vector[class_idx_for_confidence]) * 100
-                except (IndexError, ValueError) as map_err:
-                    logger.warning(f"Could not reliably map RF prediction '{rf_pred_raw_idx_or_label}' to class name or get its direct probability: {map_err}. Using max probability as fallback.")
-                    rf_prediction_label_from_model = str(rf_pred_raw_idx_or_label) 
-                    rf_top_class_confidence = float(np.max(rf_proba_vector)) * 100
-            else: 
-                rf_prediction_label_from_model = str(rf_pred_raw_idx_or_label)
-                rf_top_class_confidence = float(np.max(rf_proba_vector)) * 100
-            
-            logger.info(f"RF for '{filename}': Predicted Label='{rf_prediction_label_from_model}', Top Confidence={rf_top_class_confidence:.2f}%") # ADDED LOG
-
-            if ae_is_malware: 
-                final_type_label = rf_prediction_label_from_model 
-                confidence_to_display = rf_top_class_confidence 
-                # if final_type_label == "Benign":
-                #     final_type_label = "Unknown/Anomaly"
-                
-                if "Ransomware" in final_type_label: risk_level = "Critical"
-                elif "Trojan" in final_type_label: risk_level = "High"
-                elif "Spyware" in final_type_label: risk_level = "Medium"
-                # elif final_type_label == "Unknown/Anomaly": risk_level = "High"
-                else: risk_level = "Medium" 
-            else: 
-                final_type_label = "Benign" 
-                risk_level = "Low"
-                if rf_classes is not None and "Benign" in rf_classes:
-                    try:
-                        benign_class_idx = list(rf_classes).index("Benign")
-                        confidence_to_display = float(rf_proba_vector[benign_class_idx]) * 100
-                    except (ValueError, IndexError):
-                        confidence_to_display = 99.0 
-                else: 
-                    confidence_to_display = 99.0
-            logger.info(f"Hybrid Verdict for '{filename}': Final Type='{final_type_label}', Confidence Displayed={confidence_to_display:.2f}%, Risk='{risk_level}'") # ADDED LOG
-        except Exception as e:
-            logger.error(f"Error during model prediction for '{filename}': {e}", exc_info=True)
-
-        current_timestamp_obj = datetime.datetime.utcnow()
-        scan_result_data = {
-            "fileName": filename,
-            "scanTime": current_timestamp_obj.strftime('%Y-%m-%d %I:%M:%S %p UTC'),
-            "isMalware": ae_is_malware,
-            "malwareType": final_type_label,
-            "confidenceScore": round(confidence_to_display, 2),
-            "riskLevel": risk_level,
-            "aeVerdictOnExe": "Anomaly" if ae_is_malware else "Normal",
-            "rfRawPrediction": rf_prediction_label_from_model,
-            "aeReconstructionError": round(float(mse), 6),
-            "aeThreshold": round(float(mse_threshold), 6)
-        }
-        
-        logger.info(f"Dummy mode: Scan result for '{filename}' not saved to DB (Firestore disabled).")
-        logger.info(f"Final scan result for '{filename}': {scan_result_data}")
-        return jsonify(scan_result_data)
+        result, status_code = predict_scan_result(input_df, filename, neighbors=request.args.get('neighbors', type=int), content_hash=content_hash)
+        return jsonify(result), status_code
 
     except Exception as e:
         logger.error(f"Unhandled exception processing file '{filename}': {e}", exc_info=True)
@@ -271,6 +430,64 @@ def scan_file_route():
             except Exception as e_rem_dir:
                 logger.error(f"Error removing temporary directory {request_temp_dir}: {e_rem_dir}", exc_info=True)
 
+# --- Memory Dump Ingestion (raw Volatility plugin output) ---
+def add_memory_plugin_report(result, plugin_files):
+    """Tells the client which plugins fed the vector and which were absent (their features are 0.0)."""
+    result["aggregatedPlugins"] = sorted(plugin_files)
+    result["missingPlugins"] = missing_plugins(plugin_files)
+
+@app.route('/scan/memory', methods=['POST'])
+@admission_controlled
+def scan_memory_route():
+    if not MODELS_LOADED:
+        logger.error("Memory scan attempt failed: Models not loaded. Service unavailable.")
+        return jsonify({'status': 'error', 'message': 'Service unavailable: Essential models are not loaded.'}), 503
+
+    uploads = [(secure_filename(f.filename), f) for f in request.files.getlist('files') if f.filename]
+    plugin_files, upload_error = match_memory_plugins(uploads)
+    if upload_error is not None:
+        error_body, status_code = upload_error
+        return jsonify(error_body), status_code
+
+    dump_name = secure_filename(request.form.get('dumpName') or request.args.get('dumpName', '')) or 'memory_dump'
+    request_temp_dir = None
+
+    try:
+        request_temp_dir = tempfile.mkdtemp(dir=UPLOAD_FOLDER)
+        for plugin, upload in plugin_files.items():
+            temp_file_path = os.path.join(request_temp_dir, secure_filename(upload.filename))
+            upload.save(temp_file_path)
+            plugin_files[plugin] = temp_file_path
+        content_hash = combined_sha256({plugin: file_sha256(path) for plugin, path in plugin_files.items()})
+        logger.info(f"Memory dump '{dump_name}': saved outputs for plugins {sorted(plugin_files)} to {request_temp_dir}")
+
+        try:
+            raw_features_dict = extract_memory_features(plugin_files, expected_feature_names)
+        except MemoryFeatureError as e:
+            logger.error(f"Memory feature aggregation failed for '{dump_name}': {e}")
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        result, status_code = predict_scan_result(pd.DataFrame([raw_features_dict]), dump_name, neighbors=request.args.get('neighbors', type=int), content_hash=content_hash)
+        if status_code == 200:
+            add_memory_plugin_report(result, plugin_files)
+        return jsonify(result), status_code
+
+    except Exception as e:
+        logger.error(f"Unhandled exception processing memory dump '{dump_name}': {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'An unexpected server error occurred during memory scan.'}), 500
+    finally:
+        if request_temp_dir and os.path.exists(request_temp_dir):
+            try:
+                shutil.rmtree(request_temp_dir)
+                logger.debug(f"Temporary directory {request_temp_dir} and its contents removed.")
+            except Exception as e_rem_dir:
+                logger.error(f"Error removing temporary directory {request_temp_dir}: {e_rem_dir}", exc_info=True)
+
+# --- Health Check (lightweight lane, not subject to admission control) ---
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'ok' if MODELS_LOADED else 'degraded', 'modelsLoaded': MODELS_LOADED, 'scanAdmission': scan_admission.stats()})
+
 # --- Admin API Endpoint (Serves DUMMY DATA) ---
 @app.route('/api/admin/top-scans', methods=['GET'])
 def get_top_scans():
@@ -0,0 +1,408 @@
+# asgi_app.py (async streaming front-end)
+#
+# Serves the same API as app.py, but /scan and /scan/memory are native async views:
+# the upload body is streamed in chunks straight to disk while being hashed, the size
+# limit is enforced as bytes arrive, and PE parsing / plugin aggregation run in a process
+# pool while CSV parsing and inference run in a thread pool. One worker can therefore
+# hold hundreds of slow client uploads without tying up a CPU-bound thread per upload.
+# /health reports this front-end's own upload budget and CPU slots. All other routes
+# (/api/admin/*) are served by the Flask app through a2wsgi's WSGIMiddleware.
+#
+# Run with:  uvicorn asgi_app:app --workers 2
+#       or:  gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --workers 2
+
+import asyncio
+import contextlib
+import functools
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+from a2wsgi import WSGIMiddleware
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from werkzeug.utils import secure_filename
+
+import app as backend
+from admission import AdmissionController
+from extract_features import extract_static_features
+from extract_memory_features import extract_memory_features, MemoryFeatureError
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', 50))
+ASYNC_EXTRACT_PROCESSES = int(os.environ.get('ASYNC_EXTRACT_PROCESSES', os.cpu_count() or 2))
+ASYNC_INFERENCE_THREADS = int(os.environ.get('ASYNC_INFERENCE_THREADS', 4))
+# Scans allowed past the upload stage at once (queued on or running in the pools).
+ASYNC_MAX_CPU_INFLIGHT = int(os.environ.get('ASYNC_MAX_CPU_INFLIGHT', ASYNC_EXTRACT_PROCESSES + ASYNC_INFERENCE_THREADS))
+# Uploads being streamed to disk at once, and the bytes they may hold there together.
+ASYNC_MAX_UPLOADS = int(os.environ.get('ASYNC_MAX_UPLOADS', 64))
+ASYNC_MAX_UPLOAD_DISK_MB = float(os.environ.get('ASYNC_MAX_UPLOAD_DISK_MB', 1024))
+MAX_FORM_FIELD_BYTES = 4096  # Plain form fields (e.g. dumpName) are short; anything longer is malformed.
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadedPart:
+    """A file part of the request body, already written to disk."""
+
+    def __init__(self, field_name, filename, path):
+        self.field_name = field_name
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.fh = open(path, 'wb')
+
+    def write(self, data):
+        self.fh.write(data)
+        self.hasher.update(data)
+        self.size += len(data)
+
+    def close(self):
+        self.fh.close()
+
+    @property
+    def sha256(self):
+        return self.hasher.hexdigest()
+
+
+def error_response(message, status_code, headers=None):
+    return JSONResponse({'status': 'error', 'message': message}, status_code=status_code, headers=headers)
+
+
+async def receive_uploads(request, dest_dir, max_bytes):
+    """
+    Streams the request body into `dest_dir`, hashing each file part as it arrives.
+    Accepts multipart/form-data, or a raw body named by the ?filename= query parameter.
+    Returns (parts, fields): the list of UploadedPart objects and a dict of the plain form
+    fields. Raises UploadTooLarge as soon as more than `max_bytes` have been received, and
+    ValueError for malformed bodies or a form field longer than MAX_FORM_FIELD_BYTES.
+    """
+    parts = []
+    fields = {}
+    received = 0
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+
+    if content_type != b'multipart/form-data':
+        filename = secure_filename(request.query_params.get('filename', ''))
+        if not filename:
+            raise ValueError('Raw uploads must name the file with the "filename" query parameter.')
+        part = UploadedPart('file', filename, os.path.join(dest_dir, filename))
+        parts.append(part)
+        try:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_bytes:
+                    raise UploadTooLarge()
+                part.write(chunk)
+        finally:
+            part.close()
+        return parts, fields
+
+    boundary = params.get(b'boundary')
+    if not boundary:
+        raise ValueError('Multipart request is missing its boundary.')
+
+    state = {'header_field': b'', 'header_value': b'', 'headers': {}, 'part': None, 'field': None}
+
+    def on_part_begin():
+        state['headers'] = {}
+        state['part'] = None
+        state['field'] = None
+
+    def on_header_field(data, start, end):
+        state['header_field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state['header_value'] += data[start:end]
+
+    def on_header_end():
+        state['headers'][state['header_field'].lower()] = state['header_value']
+        state['header_field'], state['header_value'] = b'', b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state['headers'].get(b'content-disposition', b''))
+        field_name = disposition.get(b'name', b'').decode('utf-8', 'replace')
+        if b'filename' not in disposition:
+            state['field'] = (field_name, bytearray())
+            return
+        filename = secure_filename(disposition[b'filename'].decode('utf-8', 'replace'))
+        # Prefix with the part number so repeated file names cannot overwrite each other.
+        state['part'] = UploadedPart(field_name, filename, os.path.join(dest_dir, f"{len(parts)}_{filename or 'upload'}"))
+
+    def on_part_data(data, start, end):
+        if state['part'] is not None:
+            state['part'].write(data[start:end])
+        elif state['field'] is not None:
+            value = state['field'][1]
+            value += data[start:end]
+            if len(value) > MAX_FORM_FIELD_BYTES:
+                raise ValueError(f"Form field '{state['field'][0]}' exceeds {MAX_FORM_FIELD_BYTES} bytes.")
+
+    def on_part_end():
+        if state['part'] is not None:
+            state['part'].close()
+            parts.append(state['part'])
+            state['part'] = None
+        elif state['field'] is not None:
+            field_name, value = state['field']
+            fields[field_name] = value.decode('utf-8', 'replace')
+            state['field'] = None
+
+    parser = MultipartParser(boundary, {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge()
+            parser.write(chunk)
+        parser.finalize()
+    finally:
+        if state['part'] is not None:
+            state['part'].close()
+    return parts, fields
+
+
+def requested_neighbors(request):
+    try:
+        return int(request.query_params['neighbors'])
+    except (KeyError, ValueError):
+        return None
+
+
+@contextlib.asynccontextmanager
+async def cpu_slot(request):
+    """
+    Holds one of ASYNC_MAX_CPU_INFLIGHT slots for the CPU-bound stage of a scan. Yields False
+    when no slot frees up within SCAN_QUEUE_TIMEOUT, so the caller can shed the request.
+    """
+    state = request.app.state
+    try:
+        await asyncio.wait_for(state.cpu_slots.acquire(), timeout=backend.SCAN_QUEUE_TIMEOUT)
+        acquired = True
+    except asyncio.TimeoutError:
+        acquired = False
+    if acquired:
+        state.cpu_inflight += 1
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            state.cpu_inflight -= 1
+            state.cpu_slots.release()
+
+
+@contextlib.contextmanager
+def upload_dir(request, max_bytes):
+    """
+    Holds an upload budget slot and a temp directory for the request body. Yields the directory,
+    or None when the budget has no room, so the caller can shed the request. The slot is held
+    until the directory, and everything streamed into it, is removed.
+    """
+    budget = request.app.state.upload_budget
+    declared_length = request.headers.get('content-length')
+    # A chunked body is cut off at max_bytes, so that is what it is charged.
+    weight = budget.weigh(int(declared_length) if declared_length and declared_length.isdigit() else max_bytes)
+    if not budget.try_acquire(weight):
+        logger.warning(f"Upload shed before reading: upload budget full ({budget.stats()}).")
+        yield None
+        return
+    request_temp_dir = None
+    try:
+        request_temp_dir = tempfile.mkdtemp(dir=backend.UPLOAD_FOLDER)
+        yield request_temp_dir
+    finally:
+        if request_temp_dir is not None:
+            shutil.rmtree(request_temp_dir, ignore_errors=True)
+        budget.release(weight)
+
+
+def capacity_response():
+    return error_response('Scan service is at capacity. Please retry shortly.', 503,
+                          headers={'Retry-After': str(backend.SCAN_RETRY_AFTER)})
+
+
+async def run_prediction(request, input_df, name, content_hash):
+    loop = asyncio.get_running_loop()
+    predict = functools.partial(backend.predict_scan_result, input_df, name,
+                                neighbors=requested_neighbors(request), content_hash=content_hash)
+    return await loop.run_in_executor(request.app.state.inference_pool, predict)
+
+
+async def scan_file(request):
+    if not backend.MODELS_LOADED:
+        logger.error("Scan attempt failed: Models not loaded. Service unavailable.")
+        return error_response('Service unavailable: Essential models are not loaded.', 503)
+
+    max_bytes = int(MAX_UPLOAD_MB * 1024 * 1024)
+    declared_length = request.headers.get('content-length')
+    if declared_length and declared_length.isdigit() and int(declared_length) > max_bytes:
+        logger.warning(f"Upload rejected before reading: Content-Length {declared_length} exceeds {max_bytes} bytes.")
+        return error_response(f'Upload exceeds the {MAX_UPLOAD_MB:g} MB limit.', 413)
+
+    try:
+        with upload_dir(request, max_bytes) as request_temp_dir:
+            if request_temp_dir is None:
+                return capacity_response()
+            try:
+                parts, _ = await receive_uploads(request, request_temp_dir, max_bytes)
+            except UploadTooLarge:
+                logger.warning(f"Upload aborted mid-stream: exceeded {max_bytes} bytes.")
+                return error_response(f'Upload exceeds the {MAX_UPLOAD_MB:g} MB limit.', 413)
+            except ValueError as e:
+                return error_response(str(e), 400)
+
+            file_part = next((p for p in parts if p.field_name == 'file'), None)
+            filename = file_part.filename if file_part is not None else None
+            file_ext, upload_error = backend.check_scan_filename(filename)
+            if upload_error is not None:
+                error_body, status_code = upload_error
+                return JSONResponse(error_body, status_code=status_code)
+            logger.info(f"File '{filename}' streamed to disk: {file_part.size} bytes, sha256={file_part.sha256}")
+
+            async with cpu_slot(request) as admitted:
+                if not admitted:
+                    logger.warning(f"Scan of '{filename}' shed: no CPU slot within {backend.SCAN_QUEUE_TIMEOUT}s.")
+                    return capacity_response()
+
+                loop = asyncio.get_running_loop()
+                if file_ext == 'exe':
+                    raw_features_dict = await loop.run_in_executor(
+                        request.app.state.extract_pool, extract_static_features, file_part.path, backend.expected_feature_names)
+                    if raw_features_dict is None:
+                        return error_response('Failed to extract features from .exe (file might be corrupted or not a valid PE).', 500)
+                    input_df = pd.DataFrame([raw_features_dict])
+                else:
+                    input_df, csv_error = await loop.run_in_executor(
+                        request.app.state.inference_pool, backend.load_csv_input, file_part.path, filename)
+                    if csv_error is not None:
+                        error_body, status_code = csv_error
+                        return JSONResponse(error_body, status_code=status_code)
+
+                result, status_code = await run_prediction(request, input_df, filename, file_part.sha256)
+            return JSONResponse(result, status_code=status_code)
+
+    except Exception as e:
+        logger.error(f"Unhandled exception in async scan: {e}", exc_info=True)
+        return error_response('An unexpected server error occurred during scan.', 500)
+
+
+async def scan_memory(request):
+    if not backend.MODELS_LOADED:
+        logger.error("Memory scan attempt failed: Models not loaded. Service unavailable.")
+        return error_response('Service unavailable: Essential models are not loaded.', 503)
+
+    max_bytes = int(MAX_UPLOAD_MB * 1024 * 1024)
+    declared_length = request.headers.get('content-length')
+    if declared_length and declared_length.isdigit() and int(declared_length) > max_bytes:
+        return error_response(f'Upload exceeds the {MAX_UPLOAD_MB:g} MB limit.', 413)
+
+    try:
+        with upload_dir(request, max_bytes) as request_temp_dir:
+            if request_temp_dir is None:
+                return capacity_response()
+            try:
+                parts, fields = await receive_uploads(request, request_temp_dir, max_bytes)
+            except UploadTooLarge:
+                return error_response(f'Upload exceeds the {MAX_UPLOAD_MB:g} MB limit.', 413)
+            except ValueError as e:
+                return error_response(str(e), 400)
+
+            plugin_uploads, upload_error = backend.match_memory_plugins(
+                [(p.filename, p) for p in parts if p.field_name == 'files' and p.filename])
+            if upload_error is not None:
+                error_body, status_code = upload_error
+                return JSONResponse(error_body, status_code=status_code)
+            # extract_memory_features picks the reader from the extension, which the part-number prefix keeps.
+            plugin_files = {plugin: upload.path for plugin, upload in plugin_uploads.items()}
+
+            # Same form field as the Flask route; the query string is accepted for raw clients.
+            dump_name = secure_filename(fields.get('dumpName') or request.query_params.get('dumpName', '')) or 'memory_dump'
+            async with cpu_slot(request) as admitted:
+                if not admitted:
+                    return capacity_response()
+                loop = asyncio.get_running_loop()
+                try:
+                    raw_features_dict = await loop.run_in_executor(
+                        request.app.state.extract_pool, extract_memory_features, plugin_files, backend.expected_feature_names)
+                except MemoryFeatureError as e:
+                    logger.error(f"Memory feature aggregation failed for '{dump_name}': {e}")
+                    return error_response(str(e), 400)
+                content_hash = backend.combined_sha256({plugin: upload.sha256 for plugin, upload in plugin_uploads.items()})
+                result, status_code = await run_prediction(request, pd.DataFrame([raw_features_dict]), dump_name, content_hash)
+            if status_code == 200:
+                backend.add_memory_plugin_report(result, plugin_files)
+            return JSONResponse(result, status_code=status_code)
+
+    except Exception as e:
+        logger.error(f"Unhandled exception in async memory scan: {e}", exc_info=True)
+        return error_response('An unexpected server error occurred during memory scan.', 500)
+
+
+async def health(request):
+    """The async front-end's own /health: scans here are gated by the upload budget and CPU slots, not the Flask admission controller."""
+    state = request.app.state
+    return JSONResponse({
+        'status': 'ok' if backend.MODELS_LOADED else 'degraded',
+        'modelsLoaded': backend.MODELS_LOADED,
+        'uploadAdmission': state.upload_budget.stats(),
+        'cpuSlots': {'inflight': state.cpu_inflight, 'maxInflight': ASYNC_MAX_CPU_INFLIGHT},
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(starlette_app):
+    # 'spawn' keeps the TensorFlow runtime loaded in this process out of the extraction workers.
+    starlette_app.state.extract_pool = ProcessPoolExecutor(
+        max_workers=ASYNC_EXTRACT_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    starlette_app.state.inference_pool = ThreadPoolExecutor(
+        max_workers=ASYNC_INFERENCE_THREADS, thread_name_prefix='inference')
+    starlette_app.state.cpu_slots = asyncio.Semaphore(ASYNC_MAX_CPU_INFLIGHT)
+    starlette_app.state.cpu_inflight = 0
+    # Non-blocking (max_queue=0): an upload that does not fit is shed before its body is read.
+    starlette_app.state.upload_budget = AdmissionController(
+        max_inflight_bytes=int(ASYNC_MAX_UPLOAD_DISK_MB * 1024 * 1024), max_inflight_requests=ASYNC_MAX_UPLOADS,
+        max_queue=0, queue_timeout=0, retry_after=backend.SCAN_RETRY_AFTER)
+    logger.info(f"Async front-end ready: {ASYNC_EXTRACT_PROCESSES} extraction processes, "
+                f"{ASYNC_INFERENCE_THREADS} inference threads, max upload {MAX_UPLOAD_MB:g} MB, "
+                f"at most {ASYNC_MAX_UPLOADS} uploads / {ASYNC_MAX_UPLOAD_DISK_MB:g} MB on disk.")
+    try:
+        yield
+    finally:
+        starlette_app.state.extract_pool.shutdown(wait=False, cancel_futures=True)
+        starlette_app.state.inference_pool.shutdown(wait=False, cancel_futures=True)
+
+
+# CORS only on the async routes; the mounted Flask app already answers CORS itself (flask_cors).
+cors = [Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+
+app = Starlette(
+    routes=[
+        Route('/scan', scan_file, methods=['POST', 'OPTIONS'], middleware=cors),
+        Route('/scan/memory', scan_memory, methods=['POST', 'OPTIONS'], middleware=cors),
+        Route('/health', health, methods=['GET', 'OPTIONS'], middleware=cors),
+        Mount('/', app=WSGIMiddleware(backend.app)),
+    ],
+    lifespan=lifespan,
+)
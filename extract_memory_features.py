@@ -0,0 +1,483 @@
+# extract_memory_features.py
+
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+
+# --- Streaming Aggregation of Raw Volatility Plugin Output (MalMem2022 features) ---
+# Each plugin output file (CSV, JSON or JSON Lines) is read in chunks of DEFAULT_CHUNKSIZE rows.
+# Only the columns a plugin's features need are kept, and every chunk is folded into a small
+# set of running counters, so memory stays bounded no matter how many rows the dump produced.
+DEFAULT_CHUNKSIZE = 200_000
+
+TRUE_VALUES = ['true', '1', 'yes']
+FALSE_VALUES = ['false', '0', 'no']
+
+HANDLE_TYPES = ['port', 'file', 'event', 'desktop', 'key', 'thread', 'directory', 'semaphore', 'timer', 'section', 'mutant']
+
+# Volatility's VAD protection codes (vadinfo PROTECT_FLAGS). MalMem's malfind.protection is the
+# sum of these codes over all injections, e.g. three PAGE_EXECUTE_READWRITE regions -> 18.
+VAD_PROTECTION_CODES = {
+    'page_noaccess': 0,
+    'page_readonly': 1,
+    'page_execute': 2,
+    'page_execute_read': 3,
+    'page_readwrite': 4,
+    'page_writecopy': 5,
+    'page_execute_readwrite': 6,
+    'page_execute_writecopy': 7,
+}
+
+# psxview feature suffix -> accepted column names (Volatility 2 and 3 spell these differently)
+PSXVIEW_SOURCES = {
+    'pslist': ('pslist',),
+    'eprocess_pool': ('psscan', 'eprocesspool'),
+    'ethread_pool': ('thrdproc', 'thrdscan', 'ethreadpool'),
+    'pspcid_list': ('pspcid', 'pspcidlist'),
+    'csrss_handles': ('csrss', 'csrsshandles'),
+    'session': ('session',),
+    'deskthrd': ('deskthrd',),
+}
+
+
+class MemoryFeatureError(ValueError):
+    """Raised when supplied plugin output cannot be identified or aggregated."""
+
+
+def normalize_column_name(name):
+    """Lowercases a column name and strips everything but letters and digits ('Offset(V)' -> 'offsetv')."""
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+
+def _count_in(series, values):
+    """Vectorized count of entries whose normalized string form is one of `values`."""
+    return int(series.astype(str).str.strip().str.lower().isin(values).sum())
+
+
+class PluginAggregator:
+    """
+    Base class for a per-plugin streaming aggregator.
+
+    Subclasses declare `plugin` (the Volatility plugin name) and `columns`, a mapping of
+    canonical column name -> accepted (normalized) aliases. `update` receives chunks that
+    already carry the canonical column names; `finalize` returns the feature dictionary.
+    """
+    plugin = None
+    columns = {}
+
+    def __init__(self):
+        self.nrows = 0
+
+    def resolve_columns(self, raw_columns):
+        """Maps raw column names found in a file to canonical names. Returns {raw_name: canonical_name}."""
+        mapping = {}
+        for raw in raw_columns:
+            normalized = normalize_column_name(raw)
+            for canonical, aliases in self.columns.items():
+                if normalized in aliases and canonical not in mapping.values():
+                    mapping[raw] = canonical
+                    break
+        return mapping
+
+    def update(self, chunk):
+        self.nrows += len(chunk)
+
+    def finalize(self):
+        raise NotImplementedError
+
+
+class PslistAggregator(PluginAggregator):
+    plugin = 'pslist'
+    columns = {
+        'pid': ('pid',),
+        'ppid': ('ppid',),
+        'threads': ('thds', 'threads'),
+        'handles': ('hnds', 'handles'),
+        'wow64': ('wow64',),
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.ppids = set()
+        self.threads_sum = 0.0
+        self.handles_sum = 0.0
+        self.handles_rows = 0
+        self.nwow64 = 0
+
+    def update(self, chunk):
+        super().update(chunk)
+        if 'ppid' in chunk:
+            self.ppids.update(chunk['ppid'].dropna().unique().tolist())
+        if 'threads' in chunk:
+            self.threads_sum += float(pd.to_numeric(chunk['threads'], errors='coerce').sum())
+        if 'handles' in chunk:
+            handles = pd.to_numeric(chunk['handles'], errors='coerce')
+            self.handles_sum += float(handles.sum())
+            self.handles_rows += int(handles.notna().sum())
+        if 'wow64' in chunk:
+            self.nwow64 += _count_in(chunk['wow64'], TRUE_VALUES)
+
+    def finalize(self):
+        return {
+            'pslist.nproc': float(self.nrows),
+            'pslist.nppid': float(len(self.ppids)),
+            'pslist.avg_threads': self.threads_sum / self.nrows if self.nrows else 0.0,
+            'pslist.nprocs64bit': float(self.nwow64),
+            'pslist.avg_handlers': self.handles_sum / self.handles_rows if self.handles_rows else 0.0,
+        }
+
+
+class DlllistAggregator(PluginAggregator):
+    plugin = 'dlllist'
+    columns = {'pid': ('pid',)}
+
+    def __init__(self):
+        super().__init__()
+        self.pids = set()
+
+    def update(self, chunk):
+        super().update(chunk)
+        if 'pid' in chunk:
+            self.pids.update(chunk['pid'].dropna().unique().tolist())
+
+    def finalize(self):
+        return {
+            'dlllist.ndlls': float(self.nrows),
+            'dlllist.avg_dlls_per_proc': self.nrows / len(self.pids) if self.pids else 0.0,
+        }
+
+
+class HandlesAggregator(PluginAggregator):
+    plugin = 'handles'
+    columns = {'pid': ('pid',), 'type': ('type',)}
+
+    def __init__(self):
+        super().__init__()
+        self.pids = set()
+        self.type_counts = pd.Series(dtype='int64')
+
+    def update(self, chunk):
+        super().update(chunk)
+        if 'pid' in chunk:
+            self.pids.update(chunk['pid'].dropna().unique().tolist())
+        if 'type' in chunk:
+            counts = chunk['type'].astype(str).str.strip().str.lower().value_counts()
+            self.type_counts = self.type_counts.add(counts, fill_value=0)
+
+    def finalize(self):
+        features = {
+            'handles.nhandles': float(self.nrows),
+            'handles.avg_handles_per_proc': self.nrows / len(self.pids) if self.pids else 0.0,
+        }
+        for handle_type in HANDLE_TYPES:
+            features[f'handles.n{handle_type}'] = float(self.type_counts.get(handle_type, 0))
+        return features
+
+
+class LdrmodulesAggregator(PluginAggregator):
+    plugin = 'ldrmodules'
+    columns = {'inload': ('inload',), 'ininit': ('ininit',), 'inmem': ('inmem',)}
+
+    def __init__(self):
+        super().__init__()
+        self.not_in = {'load': 0, 'init': 0, 'mem': 0}
+
+    def update(self, chunk):
+        super().update(chunk)
+        for suffix in self.not_in:
+            column = f'in{suffix}'
+            if column in chunk:
+                self.not_in[suffix] += _count_in(chunk[column], FALSE_VALUES)
+
+    def finalize(self):
+        features = {}
+        for suffix, count in self.not_in.items():
+            features[f'ldrmodules.not_in_{suffix}'] = float(count)
+            features[f'ldrmodules.not_in_{suffix}_avg'] = count / self.nrows if self.nrows else 0.0
+        return features
+
+
+class MalfindAggregator(PluginAggregator):
+    plugin = 'malfind'
+    columns = {'pid': ('pid',), 'commitcharge': ('commitcharge',), 'protection': ('protection',)}
+
+    def __init__(self):
+        super().__init__()
+        self.pids = set()
+        self.commit_charge = 0.0
+        self.protection_sum = 0.0
+
+    def update(self, chunk):
+        super().update(chunk)
+        if 'pid' in chunk:
+            self.pids.update(chunk['pid'].dropna().unique().tolist())
+        if 'commitcharge' in chunk:
+            self.commit_charge += float(pd.to_numeric(chunk['commitcharge'], errors='coerce').sum())
+        if 'protection' in chunk:
+            # Numeric output already holds the VAD code; names are mapped back to their code.
+            numeric = pd.to_numeric(chunk['protection'], errors='coerce')
+            named = chunk['protection'].astype(str).str.strip().str.lower().map(VAD_PROTECTION_CODES)
+            self.protection_sum += float(numeric.fillna(named).fillna(0).sum())
+
+    def finalize(self):
+        return {
+            'malfind.ninjections': float(self.nrows),
+            'malfind.commitCharge': self.commit_charge,
+            'malfind.protection': self.protection_sum,
+            'malfind.uniqueInjections': self.nrows / len(self.pids) if self.pids else 0.0,
+        }
+
+
+class PsxviewAggregator(PluginAggregator):
+    plugin = 'psxview'
+    columns = PSXVIEW_SOURCES
+
+    def __init__(self):
+        super().__init__()
+        self.not_in = {source: 0 for source in PSXVIEW_SOURCES}
+
+    def update(self, chunk):
+        super().update(chunk)
+        for source in self.not_in:
+            if source in chunk:
+                self.not_in[source] += _count_in(chunk[source], FALSE_VALUES)
+
+    def finalize(self):
+        features = {}
+        for source, count in self.not_in.items():
+            features[f'psxview.not_in_{source}'] = float(count)
+            features[f'psxview.not_in_{source}_false_avg'] = count / self.nrows if self.nrows else 0.0
+        return features
+
+
+class ModulesAggregator(PluginAggregator):
+    plugin = 'modules'
+
+    def finalize(self):
+        return {'modules.nmodules': float(self.nrows)}
+
+
+class SvcscanAggregator(PluginAggregator):
+    plugin = 'svcscan'
+    columns = {'type': ('type', 'servicetype'), 'state': ('state',)}
+
+    # feature name -> substring of the service type column ('Type' in Vol3, 'ServiceType' in Vol2)
+    SERVICE_TYPES = {
+        'svcscan.kernel_drivers': 'service_kernel_driver',
+        'svcscan.fs_drivers': 'service_file_system_driver',
+        'svcscan.process_services': 'service_win32_own_process',
+        'svcscan.shared_process_services': 'service_win32_share_process',
+        'svcscan.interactive_process_services': 'service_interactive_process',
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.type_counts = {feature: 0 for feature in self.SERVICE_TYPES}
+        self.nactive = 0
+
+    def update(self, chunk):
+        super().update(chunk)
+        if 'type' in chunk:
+            service_types = chunk['type'].astype(str).str.lower()
+            for feature, needle in self.SERVICE_TYPES.items():
+                self.type_counts[feature] += int(service_types.str.contains(needle, regex=False).sum())
+        if 'state' in chunk:
+            self.nactive += _count_in(chunk['state'], ['service_running'])
+
+    def finalize(self):
+        features = {'svcscan.nservices': float(self.nrows), 'svcscan.nactive': float(self.nactive)}
+        features.update({feature: float(count) for feature, count in self.type_counts.items()})
+        return features
+
+
+class CallbacksAggregator(PluginAggregator):
+    plugin = 'callbacks'
+    columns = {'type': ('type',), 'module': ('module', 'owner')}
+
+    def __init__(self):
+        super().__init__()
+        self.nanonymous = 0
+        self.ngeneric = 0
+
+    def update(self, chunk):
+        super().update(chunk)
+        if 'module' in chunk:
+            self.nanonymous += _count_in(chunk['module'], ['unknown'])
+        if 'type' in chunk:
+            self.ngeneric += _count_in(chunk['type'], ['generickernelcallback'])
+
+    def finalize(self):
+        return {
+            'callbacks.ncallbacks': float(self.nrows),
+            'callbacks.nanonymous': float(self.nanonymous),
+            'callbacks.ngeneric': float(self.ngeneric),
+        }
+
+
+PLUGIN_AGGREGATORS = {
+    cls.plugin: cls for cls in (
+        PslistAggregator, DlllistAggregator, HandlesAggregator, LdrmodulesAggregator, MalfindAggregator,
+        PsxviewAggregator, ModulesAggregator, SvcscanAggregator, CallbacksAggregator,
+    )
+}
+SUPPORTED_EXTENSIONS = {'csv', 'json', 'jsonl', 'ndjson'}
+
+
+def detect_plugin(file_path):
+    """
+    Guesses the Volatility plugin from a file name, e.g. 'dump01.handles.csv' or
+    'windows.psxview.PsXView.json'. Returns the plugin name or None.
+    """
+    tokens = re.split(r'[^a-z0-9]+', os.path.basename(file_path).lower())
+    for token in tokens:
+        if token in PLUGIN_AGGREGATORS:
+            return token
+    return None
+
+
+def _flatten_volatility3_rows(rows):
+    """Flattens Volatility 3 JSON renderer output, where child rows are nested under '__children'."""
+    stack = list(reversed(rows))
+    while stack:
+        row = stack.pop()
+        children = row.get('__children') or []
+        yield {k: v for k, v in row.items() if k != '__children'}
+        stack.extend(reversed(children))
+
+
+def _iter_json_frames(file_path, chunksize):
+    """
+    Yields DataFrames from a whole-document JSON file. Supports the Volatility 2 layout
+    ({"columns": [...], "rows": [[...]]}) and the Volatility 3 layout (list of row objects).
+    The document itself is parsed in one go; prefer JSON Lines for very large dumps.
+    """
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as fh:
+        document = json.load(fh)
+
+    if isinstance(document, dict) and 'rows' in document:
+        columns = document.get('columns') or []
+        rows = document['rows']
+        for start in range(0, len(rows), chunksize):
+            yield pd.DataFrame(rows[start:start + chunksize], columns=columns or None)
+        return
+
+    if isinstance(document, dict):
+        document = [document]
+    batch = []
+    for row in _flatten_volatility3_rows(document):
+        batch.append(row)
+        if len(batch) >= chunksize:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def iter_plugin_chunks(file_path, aggregator, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streams a plugin output file as DataFrames holding only the columns `aggregator` needs,
+    renamed to their canonical names.
+    """
+    ext = file_path.rsplit('.', 1)[-1].lower() if '.' in file_path else ''
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported plugin output format '{ext}' for {file_path}.")
+
+    if ext == 'csv':
+        header = pd.read_csv(file_path, nrows=0).columns
+        mapping = aggregator.resolve_columns(header)
+        # Row-count-only plugins still need one column so that pandas reports chunk lengths.
+        usecols = list(mapping) if mapping else [header[0]]
+        frames = pd.read_csv(file_path, usecols=usecols, chunksize=chunksize, low_memory=True)
+    elif ext in ('jsonl', 'ndjson'):
+        frames = pd.read_json(file_path, lines=True, chunksize=chunksize)
+    else:
+        frames = _iter_json_frames(file_path, chunksize)
+
+    for frame in frames:
+        mapping = aggregator.resolve_columns(frame.columns)
+        if mapping:
+            yield frame[list(mapping)].rename(columns=mapping)
+        else:
+            yield pd.DataFrame(index=frame.index)
+
+
+def extract_memory_features(plugin_files, expected_feature_list, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Aggregates raw Volatility plugin output files into the MalMem feature vector.
+
+    Args:
+        plugin_files (dict or list): {plugin_name: path} or a list of paths whose plugin
+            is detected from the file name (see detect_plugin).
+        expected_feature_list (list): List of feature names the model expects.
+        chunksize (int): Rows per chunk when streaming each file.
+
+    Returns:
+        dict: A dictionary of features (all float values). Features whose plugin output was
+              not supplied default to 0.0; see missing_plugins.
+
+    Raises:
+        MemoryFeatureError: If no file is supplied, a file's plugin cannot be determined, a plugin
+            is supplied twice, or a supplied file cannot be aggregated. A partially aggregated
+            vector is never returned.
+    """
+    if not isinstance(plugin_files, dict):
+        paths, plugin_files = plugin_files, {}
+        for path in paths:
+            plugin = detect_plugin(path)
+            if plugin in plugin_files:
+                raise MemoryFeatureError(f"More than one output file supplied for plugin '{plugin}'.")
+            plugin_files[plugin] = path
+    if not plugin_files:
+        raise MemoryFeatureError("No Volatility plugin output supplied.")
+
+    features = {col_name: 0.0 for col_name in expected_feature_list}
+    aggregated_plugins = []
+
+    for plugin, file_path in plugin_files.items():
+        if plugin not in PLUGIN_AGGREGATORS:
+            raise MemoryFeatureError(f"Could not determine a supported Volatility plugin for '{os.path.basename(file_path)}'.")
+        aggregator = PLUGIN_AGGREGATORS[plugin]()
+        try:
+            for chunk in iter_plugin_chunks(file_path, aggregator, chunksize):
+                aggregator.update(chunk)
+        except Exception as e:
+            print(f"[ERROR] Aggregating {plugin} output from {file_path} failed: {e}")
+            raise MemoryFeatureError(f"Could not aggregate {plugin} output from '{os.path.basename(file_path)}': {e}") from e
+
+        for key, value in aggregator.finalize().items():
+            if key in features:
+                features[key] = float(value) if np.isfinite(value) else 0.0
+        aggregated_plugins.append(plugin)
+        print(f"Aggregated {aggregator.nrows} {plugin} rows from {os.path.basename(file_path)}.")
+
+    missing = missing_plugins(aggregated_plugins)
+    if missing:
+        print(f"[WARNING] No output supplied for plugins {missing}; their features default to 0.0.")
+    print(f"Memory features aggregated from {len(aggregated_plugins)} plugin outputs: {len(features)} features.")
+    return features
+
+
+def missing_plugins(supplied_plugins):
+    """Supported plugins absent from `supplied_plugins`, i.e. those whose features default to 0.0."""
+    return sorted(set(PLUGIN_AGGREGATORS) - set(supplied_plugins))
+
+
+if __name__ == '__main__':
+    # Usage: python extract_memory_features.py OUTPUT_CSV PLUGIN_FILE [PLUGIN_FILE ...]
+    # Writes a one-row CSV in the feature format accepted by /scan and predict.py.
+    import sys
+    import joblib
+
+    if len(sys.argv) < 3:
+        print("Usage: python extract_memory_features.py OUTPUT_CSV PLUGIN_FILE [PLUGIN_FILE ...]")
+        sys.exit(1)
+    expected_columns = joblib.load(os.path.join("models", "feature_columns.pkl"))
+    try:
+        memory_features = extract_memory_features(sys.argv[2:], expected_columns)
+    except MemoryFeatureError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    pd.DataFrame([memory_features])[expected_columns].to_csv(sys.argv[1], index=False)
+    print(f"✅ Wrote aggregated features to '{sys.argv[1]}'.")
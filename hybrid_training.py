@@ -11,6 +11,7 @@ from tensorflow.keras.layers import Input, Dense
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import joblib
 import os
+from similarity_index import SimilarityIndex, make_encoder
 
 # === Configuration ===
 # Define the percentile for AE threshold (e.g., 95th percentile of benign reconstruction errors)
@@ -141,6 +142,18 @@ joblib.dump(scaler, "models/scaler.pkl")
 autoencoder.save("models/autoencoder_model.h5")
 print("✅ All models and scaler saved to 'models/' folder.")
 
+# === Step 6b: Build nearest-known-sample index ===
+# Index the whole dataset in the autoencoder's bottleneck space so the API can show analysts
+# the most similar known samples (and their labels) for a flagged scan.
+print("\nBuilding similarity index over AE encodings...")
+encoder = make_encoder(autoencoder)
+X_encoded = encoder.predict(X_scaled, batch_size=1024)
+# MalMem's 'Category' holds the sample name (family and hash for malware, 'Benign' otherwise).
+sample_ids = df['Category'].astype(str).tolist()
+similarity_index = SimilarityIndex.build(X_encoded, y_multi.tolist(), sample_ids, source='training', space='encoded')
+similarity_index.save("models/similarity_index.pkl")
+print(f"✅ Saved similarity index with {len(similarity_index)} samples to 'models/similarity_index.pkl'.")
+
 # === Step 7: Evaluate Models on Test Set ===
 print("\n--- Evaluating AutoEncoder (Anomaly Detection) on Test Set ---")
 test_reconstructions = autoencoder.predict(X_test)
@@ -0,0 +1,411 @@
+# load_replay.py
+
+import argparse
+import datetime
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+# --- Load Replay Harness ---
+# Drives a locally started backend (gunicorn or the Flask dev server) or an already running one
+# with a recorded or synthetic request log, then reports throughput, latency percentiles,
+# error rates and worker RSS over time.
+#
+# Recorded logs are JSON Lines, one request per line:
+#   {"offset": 0.25, "kind": "csv", "file": "sample_input_for_prediction.csv"}
+#   {"offset": 0.40, "kind": "exe", "file": "samples/putty.exe"}
+#   {"offset": 0.41, "kind": "admin"}
+#   {"offset": 0.90, "kind": "memory", "files": ["dump/pslist.csv", "dump/handles.csv"]}
+# 'offset' is seconds since the start of the recording and is optional; without it the
+# entries are sent at --rate (or as fast as --concurrency allows).
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV_SAMPLE = os.path.join(APP_DIR, "sample_input_for_prediction.csv")
+ROUTES = {
+    'exe': ('POST', '/scan'),
+    'csv': ('POST', '/scan'),
+    'memory': ('POST', '/scan/memory'),
+    'admin': ('GET', '/api/admin/top-scans'),
+}
+PERCENTILES = [50, 95, 99]
+# Defaults mirror the Procfile so a plain replay measures the deployed gunicorn setup.
+PROCFILE_WORKER_CLASS = 'gthread'
+PROCFILE_THREADS = 8
+
+_thread_local = threading.local()
+
+
+def _session():
+    """One requests.Session per client thread so connections are reused without sharing state."""
+    if not hasattr(_thread_local, 'session'):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+def parse_mix(mix_spec):
+    """Parses 'csv=0.6,exe=0.3,admin=0.1' into a {kind: weight} dict."""
+    mix = {}
+    for part in mix_spec.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in ROUTES:
+            raise ValueError(f"Unknown request kind '{kind}' in mix. Choose from: {', '.join(ROUTES)}.")
+        mix[kind] = float(weight or 1.0)
+    return mix
+
+
+def load_request_log(log_path):
+    """Reads a recorded JSON Lines request log. Entries are returned sorted by offset when present."""
+    entries = []
+    with open(log_path, 'r', encoding='utf-8') as fh:
+        for line_no, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if entry.get('kind') not in ROUTES:
+                raise ValueError(f"{log_path}:{line_no}: unknown request kind '{entry.get('kind')}'.")
+            entries.append(entry)
+    if entries and all('offset' in e for e in entries):
+        entries.sort(key=lambda e: e['offset'])
+    return entries
+
+
+def synthesize_request_log(total, mix, samples, seed=None):
+    """Builds `total` synthetic entries drawn from `mix`, using one sample file per kind."""
+    rng = random.Random(seed)
+    kinds = [k for k in mix if mix[k] > 0]
+    weights = [mix[k] for k in kinds]
+    entries = []
+    for _ in range(total):
+        kind = rng.choices(kinds, weights=weights)[0]
+        entry = {'kind': kind}
+        if kind == 'memory':
+            entry['files'] = samples['memory']
+        elif kind != 'admin':
+            entry['file'] = samples[kind]
+        entries.append(entry)
+    return entries
+
+
+def schedule_offsets(entries, rate, speed, seed=None):
+    """
+    Returns the send time (seconds from start) of every entry, or None for closed-loop mode.
+    Recorded offsets are replayed scaled by `speed`; otherwise a positive `rate` gives Poisson arrivals.
+    """
+    if entries and all('offset' in e for e in entries) and rate <= 0:
+        return [float(e['offset']) / speed for e in entries]
+    if rate > 0:
+        rng = np.random.default_rng(seed)
+        return np.cumsum(rng.exponential(1.0 / rate, size=len(entries))).tolist()
+    return None
+
+
+def send_request(base_url, entry, timeout):
+    """
+    Sends one logged request. Returns (status_code or None, error string or None).
+    Never raises: a bad file path in a log or any client-side failure is reported as an error.
+    """
+    method, path = ROUTES[entry['kind']]
+    url = base_url.rstrip('/') + path
+    handles = []
+    try:
+        if entry['kind'] == 'admin':
+            response = _session().request(method, url, timeout=timeout)
+        elif entry['kind'] == 'memory':
+            # Open one at a time so handles opened before a failing path are still closed below.
+            for file_path in entry['files']:
+                handles.append(open(file_path, 'rb'))
+            files = [('files', (os.path.basename(p), fh)) for p, fh in zip(entry['files'], handles)]
+            response = _session().request(method, url, files=files, timeout=timeout)
+        else:
+            handles.append(open(entry['file'], 'rb'))
+            files = {'file': (os.path.basename(entry['file']), handles[0])}
+            response = _session().request(method, url, files=files, timeout=timeout)
+        return response.status_code, None
+    except requests.RequestException as e:
+        return None, type(e).__name__
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+def read_rss_kb(pid):
+    """Resident set size of a process in KiB from /proc, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as fh:
+            for line in fh:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def child_pids(pid):
+    """Direct children of a process (gunicorn workers under the master), read from /proc."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", 'r') as fh:
+            return [int(p) for p in fh.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of a server process and its workers every `interval` seconds."""
+
+    def __init__(self, root_pid, interval):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._start_time = time.monotonic()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            workers = {pid: read_rss_kb(pid) for pid in child_pids(self.root_pid)}
+            self.samples.append({
+                'elapsed': round(time.monotonic() - self._start_time, 3),
+                'master_kb': read_rss_kb(self.root_pid),
+                'workers_kb': {str(pid): kb for pid, kb in workers.items() if kb is not None},
+            })
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server, port, workers, threads, worker_class, gunicorn_args):
+    """Starts the backend in a subprocess. Returns the Popen handle."""
+    if server == 'gunicorn':
+        cmd = ['gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+               '--worker-class', worker_class, '--threads', str(threads)] + gunicorn_args
+    else:
+        cmd = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--host', '127.0.0.1', '--port', str(port),
+               '--no-reload', '--no-debugger', '--with-threads']
+    print(f"🚀 Starting server: {' '.join(cmd)}")
+    return subprocess.Popen(cmd, cwd=APP_DIR, start_new_session=True)
+
+
+def wait_until_ready(base_url, proc, timeout):
+    """Polls /health until the server answers (any HTTP status) or `timeout` expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"Server process exited early with code {proc.returncode}.")
+        try:
+            requests.get(base_url.rstrip('/') + '/health', timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s.")
+
+
+def stop_server(proc):
+    if proc is None or proc.poll() is not None:
+        return
+    os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def replay(base_url, entries, offsets, concurrency, timeout):
+    """
+    Sends every entry and records one result per request. In open-loop mode latency is measured
+    from the scheduled send time, so queueing inside the harness counts against the server
+    instead of being hidden (no coordinated omission).
+    """
+    results = []
+    results_lock = threading.Lock()
+
+    def run_one(entry, scheduled_at):
+        started = time.monotonic()
+        status, error = send_request(base_url, entry, timeout)
+        finished = time.monotonic()
+        with results_lock:
+            results.append({
+                'kind': entry['kind'],
+                'status': status,
+                'error': error,
+                'latency': finished - (scheduled_at if scheduled_at is not None else started),
+                'finished': finished,
+            })
+
+    start = time.monotonic()
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, entry in enumerate(entries):
+            scheduled_at = None
+            if offsets is not None:
+                scheduled_at = start + offsets[i]
+                delay = scheduled_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(run_one, entry, scheduled_at))
+    # Surface anything that escaped run_one instead of silently dropping the request from the report.
+    for future in futures:
+        future.result()
+    if len(results) != len(entries):
+        raise RuntimeError(f"Recorded {len(results)} results for {len(entries)} requests.")
+    return results, start
+
+
+def summarize(results, start, rss_samples):
+    """Builds the report dictionary: overall and per-kind throughput, latency percentiles and error rates."""
+    def stats(rows):
+        if not rows:
+            return {'requests': 0}
+        latencies_ms = np.array([r['latency'] for r in rows]) * 1000
+        errors = [r for r in rows if r['status'] is None or r['status'] >= 400]
+        duration = max(r['finished'] for r in rows) - start
+        summary = {
+            'requests': len(rows),
+            'throughput_rps': round(len(rows) / duration, 2) if duration > 0 else 0.0,
+            'error_rate': round(len(errors) / len(rows), 4),
+            'mean_ms': round(float(latencies_ms.mean()), 2),
+        }
+        for pct, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES)):
+            summary[f'p{pct}_ms'] = round(float(value), 2)
+        status_counts = {}
+        for r in rows:
+            key = str(r['status']) if r['status'] is not None else r['error']
+            status_counts[key] = status_counts.get(key, 0) + 1
+        summary['status_counts'] = status_counts
+        return summary
+
+    report = {'overall': stats(results), 'by_kind': {}}
+    for kind in sorted({r['kind'] for r in results}):
+        report['by_kind'][kind] = stats([r for r in results if r['kind'] == kind])
+    if rss_samples:
+        report['rss_samples'] = rss_samples
+        peak_total = max((s['master_kb'] or 0) + sum(s['workers_kb'].values()) for s in rss_samples)
+        peak_worker = max((max(s['workers_kb'].values()) for s in rss_samples if s['workers_kb']), default=0)
+        report['rss_peak_total_mb'] = round(peak_total / 1024, 1)
+        report['rss_peak_worker_mb'] = round(peak_worker / 1024, 1)
+    return report
+
+
+def print_report(report):
+    print("\n--- Load Replay Results ---")
+    rows = [('overall', report['overall'])] + list(report['by_kind'].items())
+    print(f"{'kind':<8} {'reqs':>6} {'rps':>8} {'err%':>6} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9}")
+    for name, s in rows:
+        if not s.get('requests'):
+            continue
+        print(f"{name:<8} {s['requests']:>6} {s['throughput_rps']:>8.2f} {s['error_rate'] * 100:>6.2f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+        print(f"         statuses: {s['status_counts']}")
+    if 'rss_samples' in report:
+        print(f"\nPeak RSS: total {report['rss_peak_total_mb']} MB, largest worker {report['rss_peak_worker_mb']} MB "
+              f"({len(report['rss_samples'])} samples)")
+        for sample in report['rss_samples'][:: max(1, len(report['rss_samples']) // 10)]:
+            workers_mb = [round(kb / 1024, 1) for kb in sample['workers_kb'].values()]
+            print(f"  t={sample['elapsed']:>7.1f}s master={round((sample['master_kb'] or 0) / 1024, 1)} MB workers={workers_mb}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded or synthetic scan traffic against the backend.")
+    parser.add_argument('--server', choices=['gunicorn', 'flask', 'external'], default='gunicorn',
+                        help="Start gunicorn or the Flask server locally, or target an already running --url.")
+    parser.add_argument('--url', help="Base URL of an already running server (implies --server external).")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument('--worker-class', default=PROCFILE_WORKER_CLASS, help="gunicorn worker class (default matches the Procfile).")
+    parser.add_argument('--threads', type=int, default=PROCFILE_THREADS, help="gunicorn threads per worker (default matches the Procfile).")
+    parser.add_argument('--gunicorn-arg', action='append', default=[], help="Extra argument passed to gunicorn (repeatable).")
+    parser.add_argument('--log', help="Recorded JSON Lines request log to replay.")
+    parser.add_argument('--requests', type=int, default=200, help="Number of synthetic requests when no --log is given.")
+    parser.add_argument('--mix', default='csv=0.7,admin=0.3', help="Synthetic mix, e.g. csv=0.5,exe=0.4,admin=0.1.")
+    parser.add_argument('--csv-sample', default=DEFAULT_CSV_SAMPLE, help="CSV file used for synthetic csv requests.")
+    parser.add_argument('--exe-sample', help="PE file used for synthetic exe requests.")
+    parser.add_argument('--memory-sample', action='append', default=[], help="Plugin output file for synthetic memory requests (repeatable).")
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum requests in flight.")
+    parser.add_argument('--rate', type=float, default=0.0, help="Open-loop arrival rate in req/s (Poisson). 0 = closed loop / recorded offsets.")
+    parser.add_argument('--speed', type=float, default=1.0, help="Speed-up factor applied to recorded offsets.")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument('--rss-interval', type=float, default=1.0, help="Seconds between RSS samples (locally started servers only).")
+    parser.add_argument('--seed', type=int, help="Seed for synthetic mixes and arrivals.")
+    parser.add_argument('--report-json', help="Write the full report, including the RSS time series, to this file.")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1.")
+    if args.speed <= 0:
+        parser.error("--speed must be greater than 0.")
+    if args.rate < 0:
+        parser.error("--rate must not be negative.")
+
+    if args.log:
+        entries = load_request_log(args.log)
+    else:
+        mix = parse_mix(args.mix)
+        samples = {'csv': args.csv_sample, 'exe': args.exe_sample, 'memory': args.memory_sample}
+        for kind in ('exe', 'memory'):
+            if mix.get(kind) and not samples[kind]:
+                print(f"⚠️ No --{kind}-sample given; dropping '{kind}' from the synthetic mix.")
+                mix.pop(kind)
+        if not mix:
+            parser.error("The synthetic mix is empty.")
+        entries = synthesize_request_log(args.requests, mix, samples, args.seed)
+    if not entries:
+        parser.error("No requests to replay.")
+    offsets = schedule_offsets(entries, args.rate, args.speed, args.seed)
+
+    proc = None
+    sampler = None
+    base_url = args.url
+    try:
+        if base_url is None and args.server != 'external':
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            proc = start_server(args.server, port, args.workers, args.threads, args.worker_class, args.gunicorn_arg)
+        elif base_url is None:
+            parser.error("--server external requires --url.")
+        wait_until_ready(base_url, proc, timeout=120)
+        if proc is not None:
+            sampler = RssSampler(proc.pid, args.rss_interval)
+            sampler.start()
+
+        mode = 'recorded offsets' if offsets is not None and args.rate <= 0 else (f'{args.rate} req/s open loop' if offsets is not None else 'closed loop')
+        print(f"📈 Replaying {len(entries)} requests against {base_url} ({mode}, concurrency {args.concurrency})...")
+        results, start = replay(base_url, entries, offsets, args.concurrency, args.timeout)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            sampler.join(timeout=5)
+        stop_server(proc)
+
+    report = summarize(results, start, sampler.samples if sampler else [])
+    report['config'] = {
+        'server': args.server if args.url is None else 'external', 'workers': args.workers, 'worker_class': args.worker_class, 'threads': args.threads,
+        'concurrency': args.concurrency, 'rate': args.rate, 'log': args.log,
+        'generated_at': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC'),
+    }
+    print_report(report)
+    if args.report_json:
+        with open(args.report_json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+        print(f"✅ Report written to '{args.report_json}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+# similarity_index.py
+
+import sqlite3
+import threading
+import numpy as np
+import joblib
+from sklearn.cluster import MiniBatchKMeans
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Dense
+
+# --- Nearest-Known-Sample Index ---
+# An inverted-file (IVF) index: vectors are bucketed by their nearest k-means centroid, and a
+# query scans only the `nprobe` buckets closest to it. With ~sqrt(N) buckets this keeps top-k
+# queries in the low milliseconds at millions of vectors, and inserts are a single append.
+# Vectors are either the scaled features or the autoencoder's bottleneck encoding (see make_encoder / make_scoring_model).
+
+INITIAL_LIST_CAPACITY = 64
+DEFAULT_NPROBE = 8
+
+
+def _bottleneck_layer(autoencoder):
+    """The autoencoder's 'encoded' layer: the narrowest Dense layer of the network built in hybrid_training.py."""
+    dense_layers = [layer for layer in autoencoder.layers if isinstance(layer, Dense)]
+    return min(dense_layers[:-1], key=lambda layer: layer.units)
+
+
+def make_encoder(autoencoder):
+    """Returns a model mapping scaled features to the autoencoder's bottleneck encoding."""
+    return Model(autoencoder.input, _bottleneck_layer(autoencoder).output)
+
+
+def make_scoring_model(autoencoder):
+    """
+    Returns a model producing [reconstruction, bottleneck encoding] from one forward pass, so
+    scoring a scan and locating it in the index does not cost a second predict call.
+    """
+    return Model(autoencoder.input, [autoencoder.output, _bottleneck_layer(autoencoder).output])
+
+
+class SimilarityIndex:
+    """
+    IVF nearest-neighbour index with incremental inserts.
+
+    Args:
+        centroids (np.ndarray): Coarse quantizer centroids, shape (n_lists, dim).
+        space (str): Which vectors the index holds, 'encoded' or 'scaled'.
+    """
+
+    def __init__(self, centroids, space='encoded'):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.space = space
+        n_lists, dim = self.centroids.shape
+        self.dim = dim
+        self._list_vectors = [np.empty((INITIAL_LIST_CAPACITY, dim), dtype=np.float32) for _ in range(n_lists)]
+        self._list_rows = [np.empty(INITIAL_LIST_CAPACITY, dtype=np.int64) for _ in range(n_lists)]
+        self._list_sizes = np.zeros(n_lists, dtype=np.int64)
+        self.sample_ids = []
+        self.labels = []
+        self.sources = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, vectors, labels, sample_ids, source='training', space='encoded', n_lists=None, random_state=42):
+        """Trains the coarse quantizer on `vectors` (about sqrt(N) lists by default) and inserts them all."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if n_lists is None:
+            n_lists = int(np.clip(np.sqrt(len(vectors)), 1, 4096))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, batch_size=4096, n_init=3)
+        kmeans.fit(vectors)
+        index = cls(kmeans.cluster_centers_, space=space)
+        index.add(vectors, labels, sample_ids, source=source)
+        return index
+
+    def __len__(self):
+        return len(self.sample_ids)
+
+    def _centroid_scores(self, vectors):
+        # ||v - c||^2 = ||v||^2 - 2 v.c + ||c||^2; ||v||^2 is constant per row and can be dropped.
+        return (self.centroids ** 2).sum(axis=1)[None, :] - 2.0 * vectors @ self.centroids.T
+
+    def add(self, vectors, labels, sample_ids, source='scan'):
+        """Inserts vectors with their labels and ids. Safe to call while other threads search."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}.")
+        assignments = np.argmin(self._centroid_scores(vectors), axis=1)
+
+        with self._lock:
+            first_row = len(self.sample_ids)
+            self.sample_ids.extend(sample_ids)
+            self.labels.extend(labels)
+            self.sources.extend([source] * len(vectors))
+            rows = np.arange(first_row, first_row + len(vectors), dtype=np.int64)
+
+            for list_id in np.unique(assignments):
+                members = np.flatnonzero(assignments == list_id)
+                size = self._list_sizes[list_id]
+                needed = size + len(members)
+                if needed > len(self._list_rows[list_id]):
+                    capacity = max(needed, 2 * len(self._list_rows[list_id]))
+                    grown_vectors = np.empty((capacity, self.dim), dtype=np.float32)
+                    grown_vectors[:size] = self._list_vectors[list_id][:size]
+                    grown_rows = np.empty(capacity, dtype=np.int64)
+                    grown_rows[:size] = self._list_rows[list_id][:size]
+                    self._list_vectors[list_id] = grown_vectors
+                    self._list_rows[list_id] = grown_rows
+                self._list_vectors[list_id][size:needed] = vectors[members]
+                self._list_rows[list_id][size:needed] = rows[members]
+                self._list_sizes[list_id] = needed
+
+    def search(self, vector, k=5, nprobe=DEFAULT_NPROBE):
+        """
+        Returns up to `k` nearest stored samples to `vector` as a list of
+        {'sampleId', 'label', 'source', 'distance'} dicts, closest first.
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        nprobe = min(nprobe, len(self.centroids))
+        probe_lists = np.argpartition(self._centroid_scores(query)[0], nprobe - 1)[:nprobe]
+
+        with self._lock:
+            candidate_vectors = [self._list_vectors[i][:self._list_sizes[i]] for i in probe_lists]
+            candidate_rows = [self._list_rows[i][:self._list_sizes[i]] for i in probe_lists]
+            candidate_vectors = np.concatenate(candidate_vectors)
+            candidate_rows = np.concatenate(candidate_rows)
+            if len(candidate_rows) == 0:
+                return []
+
+            distances = np.square(candidate_vectors - query).sum(axis=1)
+            top = min(k, len(distances))
+            nearest = np.argpartition(distances, top - 1)[:top]
+            nearest = nearest[np.argsort(distances[nearest])]
+            return [
+                {
+                    'sampleId': self.sample_ids[candidate_rows[i]],
+                    'label': self.labels[candidate_rows[i]],
+                    'source': self.sources[candidate_rows[i]],
+                    'distance': round(float(np.sqrt(distances[i])), 6),
+                }
+                for i in nearest
+            ]
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        # Drop unused capacity so the pickle only holds real vectors.
+        state['_list_vectors'] = [v[:n].copy() for v, n in zip(self._list_vectors, self._list_sizes)]
+        state['_list_rows'] = [r[:n].copy() for r, n in zip(self._list_rows, self._list_sizes)]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+
+class ScanHistory:
+    """
+    Bounded, de-duplicated store of scanned samples, kept apart from the training index.
+
+    Entries live in a SQLite file, so the history survives restarts and is shared by every
+    worker process on the host. Each sample is keyed by its content hash: a rescan replaces
+    the earlier entry instead of adding a duplicate. At most the newest `max_entries` are kept.
+    Each worker caches the vectors in memory and refreshes the cache incrementally: ids only
+    grow, evictions drop the oldest ids, and replacements share the hash of a newer row.
+    A rescan gets a new id, so eviction counts rows rather than comparing ids.
+    Labels are the model's own verdicts, not ground truth.
+
+    Args:
+        db_path (str): SQLite file holding the history.
+        dim (int): Vector dimension; rows of another dimension (e.g. from a previous model) are ignored.
+        max_entries (int): Maximum number of scans kept.
+    """
+
+    def __init__(self, db_path, dim, max_entries):
+        self.db_path = db_path
+        self.dim = dim
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._hashes, self._labels, self._file_names, self._scanned_at = [], [], [], []
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scan_history ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " content_hash TEXT NOT NULL UNIQUE,"
+                " dim INTEGER NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " label TEXT NOT NULL,"
+                " file_name TEXT NOT NULL,"
+                " scanned_at TEXT NOT NULL)"
+            )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared across threads; keep one per thread.
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(self.db_path, timeout=10)
+        return self._local.conn
+
+    def add(self, content_hash, vector, label, file_name, scanned_at):
+        """Records a scan, replacing any earlier scan of the same content, then evicts the oldest beyond max_entries."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_history (content_hash, dim, vector, label, file_name, scanned_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, len(vector), vector.tobytes(), label, file_name, scanned_at),
+            )
+            conn.execute(
+                "DELETE FROM scan_history WHERE id NOT IN"
+                " (SELECT id FROM scan_history ORDER BY id DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def _refresh(self):
+        conn = self._connection()
+        min_id, = conn.execute("SELECT COALESCE(MIN(id), 0) FROM scan_history").fetchone()
+        last_id = int(self._ids[-1]) if len(self._ids) else 0
+        new_rows = conn.execute(
+            "SELECT id, content_hash, vector, label, file_name, scanned_at, dim FROM scan_history"
+            " WHERE id > ? ORDER BY id",
+            (last_id,),
+        ).fetchall()
+
+        # A rescan replaces the cached row even when the new row is of another dimension.
+        replaced = {row[1] for row in new_rows}
+        new_rows = [row for row in new_rows if row[6] == self.dim]
+        evicted = len(self._ids) and self._ids[0] < min_id
+        keep = [i for i, (row_id, content_hash) in enumerate(zip(self._ids, self._hashes))
+                if row_id >= min_id and content_hash not in replaced] if (evicted or replaced) else None
+        if keep is not None and len(keep) != len(self._ids):
+            self._ids = self._ids[keep]
+            self._vectors = self._vectors[keep]
+            self._hashes = [self._hashes[i] for i in keep]
+            self._labels = [self._labels[i] for i in keep]
+            self._file_names = [self._file_names[i] for i in keep]
+            self._scanned_at = [self._scanned_at[i] for i in keep]
+        if new_rows:
+            self._ids = np.concatenate([self._ids, np.array([row[0] for row in new_rows], dtype=np.int64)])
+            self._vectors = np.vstack([self._vectors] + [np.frombuffer(row[2], dtype=np.float32)[None, :] for row in new_rows])
+            self._hashes.extend(row[1] for row in new_rows)
+            self._labels.extend(row[3] for row in new_rows)
+            self._file_names.extend(row[4] for row in new_rows)
+            self._scanned_at.extend(row[5] for row in new_rows)
+
+    def search(self, vector, k=5, exclude_hash=None):
+        """
+        Returns up to `k` nearest previous scans as {'fileName', 'sha256', 'label', 'scanTime', 'distance'}
+        dicts, closest first. The scan being answered (`exclude_hash`) is never returned as its own neighbour.
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            self._refresh()
+            if len(self._ids) == 0:
+                return []
+            distances = np.square(self._vectors - query).sum(axis=1)
+            if exclude_hash is not None:
+                distances[[i for i, h in enumerate(self._hashes) if h == exclude_hash]] = np.inf
+            top = min(k, int(np.isfinite(distances).sum()))
+            if top == 0:
+                return []
+            nearest = np.argpartition(distances, top - 1)[:top]
+            nearest = nearest[np.argsort(distances[nearest])]
+            return [
+                {
+                    'fileName': self._file_names[i],
+                    'sha256': self._hashes[i],
+                    'label': self._labels[i],
+                    'scanTime': self._scanned_at[i],
+                    'distance': round(float(np.sqrt(distances[i])), 6),
+                }
+                for i in nearest
+            ]
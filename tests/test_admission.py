@@ -0,0 +1,85 @@
+# tests/test_admission.py
+
+import threading
+import time
+
+from admission import AdmissionController, MIN_REQUEST_WEIGHT
+
+MB = 1024 * 1024
+
+
+def make_controller(max_queue=4, queue_timeout=2.0):
+    return AdmissionController(max_inflight_bytes=64 * MB, max_inflight_requests=2,
+                               max_queue=max_queue, queue_timeout=queue_timeout, retry_after=5)
+
+
+def start_waiter(controller, weight, outcome):
+    thread = threading.Thread(target=lambda: outcome.append(controller.try_acquire(weight)))
+    thread.start()
+    return thread
+
+
+def wait_for_queue(controller, queued):
+    deadline = time.monotonic() + 2
+    while controller.stats()['queued'] != queued:
+        assert time.monotonic() < deadline, "waiters never queued"
+        time.sleep(0.01)
+
+
+def test_weigh():
+    controller = make_controller()
+    assert controller.weigh(10) == MIN_REQUEST_WEIGHT
+    assert controller.weigh(100 * MB) == 64 * MB
+    assert controller.weigh(None) == 64 * MB
+
+
+def test_admit_and_release():
+    controller = make_controller()
+    assert controller.try_acquire(40 * MB)
+    assert controller.try_acquire(MIN_REQUEST_WEIGHT)
+    assert controller.stats()['inflightRequests'] == 2
+    controller.release(MIN_REQUEST_WEIGHT)
+    controller.release(40 * MB)
+    assert controller.stats()['inflightBytes'] == 0
+
+
+def test_queued_request_is_admitted_on_release():
+    controller = make_controller()
+    assert controller.try_acquire(40 * MB)
+    outcome = []
+    waiter = start_waiter(controller, 40 * MB, outcome)
+    wait_for_queue(controller, 1)
+    controller.release(40 * MB)
+    waiter.join(2)
+    assert outcome == [True]
+    assert controller.stats()['inflightBytes'] == 40 * MB
+
+
+def test_request_that_fits_is_admitted_while_queue_is_full():
+    controller = make_controller(max_queue=2, queue_timeout=0.5)
+    assert controller.try_acquire(40 * MB)
+    outcome = []
+    waiters = [start_waiter(controller, 40 * MB, outcome) for _ in range(2)]
+    wait_for_queue(controller, 2)
+
+    assert controller.try_acquire(100 * 1024)
+    controller.release(100 * 1024)
+
+    # A request that does not fit is shed right away once the queue is full.
+    assert not controller.try_acquire(40 * MB)
+    assert controller.stats()['rejected'] == 1
+
+    controller.release(40 * MB)
+    for waiter in waiters:
+        waiter.join(3)
+    assert outcome.count(True) == 1  # Only one 40 MB scan fits the 64 MB budget at a time.
+
+
+def test_queued_request_is_shed_on_timeout():
+    controller = make_controller(queue_timeout=0.1)
+    assert controller.try_acquire(40 * MB)
+    started = time.monotonic()
+    assert not controller.try_acquire(40 * MB)
+    assert time.monotonic() - started >= 0.1
+    stats = controller.stats()
+    assert (stats['queued'], stats['rejected'], stats['inflightRequests']) == (0, 1, 1)
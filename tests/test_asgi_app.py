@@ -0,0 +1,68 @@
+# tests/test_asgi_app.py
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")  # Required by starlette.testclient.
+asgi_app = pytest.importorskip("asgi_app")
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def client(tmp_path):
+    async def upload(request):
+        max_bytes = int(request.query_params.get('max_bytes', 1024))
+        try:
+            parts, fields = await asgi_app.receive_uploads(request, str(tmp_path), max_bytes)
+        except asgi_app.UploadTooLarge:
+            return JSONResponse({'error': 'too large'}, status_code=413)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        return JSONResponse({
+            'parts': [{'field': p.field_name, 'filename': p.filename, 'size': p.size, 'sha256': p.sha256,
+                       'content': open(p.path, 'rb').read().decode()} for p in parts],
+            'fields': fields,
+        })
+
+    return TestClient(Starlette(routes=[Route('/upload', upload, methods=['POST'])]))
+
+
+def test_multipart_files_and_form_fields(client):
+    response = client.post('/upload', files=[('files', ('pslist.csv', b'a,b\n1,2\n')), ('files', ('../handles.csv', b'x'))],
+                           data={'dumpName': 'host-01'})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['fields'] == {'dumpName': 'host-01'}
+    assert [(p['field'], p['filename'], p['content']) for p in body['parts']] == [
+        ('files', 'pslist.csv', 'a,b\n1,2\n'), ('files', 'handles.csv', 'x')]
+    assert body['parts'][1]['sha256'] == '2d711642b726b04401627ca9fbac32f5c8530fb1903cc4db02258717921a4881'
+
+
+def test_raw_body_is_named_by_query_parameter(client):
+    response = client.post('/upload?filename=sample.csv', content=b'1,2,3\n', headers={'content-type': 'text/csv'})
+    assert response.status_code == 200
+    assert response.json()['parts'][0]['filename'] == 'sample.csv'
+    assert response.json()['parts'][0]['size'] == 6
+
+    assert client.post('/upload', content=b'1,2,3\n', headers={'content-type': 'text/csv'}).status_code == 400
+
+
+def test_upload_is_cut_off_mid_stream(client):
+    def chunks():
+        for _ in range(8):
+            yield b'x' * 512
+
+    # Chunked, so no Content-Length: only the streamed byte count can stop it.
+    assert client.post('/upload?filename=big.csv&max_bytes=1024', content=chunks()).status_code == 413
+    assert client.post('/upload?max_bytes=1024', files={'file': ('big.csv', b'x' * 2048)}).status_code == 413
+
+
+def test_form_field_is_capped(client):
+    response = client.post('/upload?max_bytes=65536', files={'file': ('a.csv', b'1')},
+                           data={'dumpName': 'x' * (asgi_app.MAX_FORM_FIELD_BYTES + 1)})
+    assert response.status_code == 400
+    assert 'dumpName' in response.json()['error']
@@ -0,0 +1,135 @@
+# tests/test_extract_memory_features.py
+
+import json
+import pytest
+
+from extract_memory_features import extract_memory_features, missing_plugins, MemoryFeatureError
+
+FEATURES = [
+    'pslist.nproc', 'pslist.nppid', 'pslist.avg_threads', 'pslist.avg_handlers',
+    'dlllist.ndlls', 'dlllist.avg_dlls_per_proc',
+    'handles.nhandles', 'handles.avg_handles_per_proc', 'handles.nmutant', 'handles.nfile',
+    'ldrmodules.not_in_load', 'ldrmodules.not_in_load_avg', 'ldrmodules.not_in_mem_avg',
+    'malfind.ninjections', 'malfind.commitCharge', 'malfind.protection', 'malfind.uniqueInjections',
+    'psxview.not_in_pslist', 'psxview.not_in_pslist_false_avg',
+]
+
+
+@pytest.fixture
+def plugin_dir(tmp_path):
+    (tmp_path / "pslist.csv").write_text(
+        "Offset(V),Name,PID,PPID,Thds,Hnds,Wow64\n"
+        "0x1,System,4,0,100,500,False\n"
+        "0x2,smss.exe,300,4,2,30,False\n"
+        "0x3,csrss.exe,400,300,9,400,False\n"
+    )
+    (tmp_path / "dlllist.csv").write_text(
+        "Pid,Base,Size,Path\n" + "".join(f"{pid},0x{i},1,C:\\x{i}.dll\n" for i, pid in enumerate([300, 300, 300, 400, 400]))
+    )
+    (tmp_path / "handles.jsonl").write_text("".join(json.dumps(row) + "\n" for row in [
+        {"PID": 300, "Type": "Mutant"},
+        {"PID": 300, "Type": "File"},
+        {"PID": 400, "Type": "File"},
+        {"PID": 400, "Type": "Key"},
+    ]))
+    (tmp_path / "ldrmodules.csv").write_text(
+        "Pid,Process,Base,InLoad,InInit,InMem,MappedPath\n"
+        "300,smss.exe,0x1,True,True,True,a\n"
+        "300,smss.exe,0x2,False,False,False,b\n"
+        "400,csrss.exe,0x3,True,False,True,c\n"
+        "400,csrss.exe,0x4,True,True,True,d\n"
+    )
+    # Volatility 3 JSON layout, protection reported by name.
+    (tmp_path / "windows.malfind.Malfind.json").write_text(json.dumps([
+        {"PID": 300, "Process": "smss.exe", "Protection": "PAGE_EXECUTE_READWRITE", "CommitCharge": 4, "__children": []},
+        {"PID": 300, "Process": "smss.exe", "Protection": "PAGE_EXECUTE_READWRITE", "CommitCharge": 1, "__children": []},
+        {"PID": 400, "Process": "csrss.exe", "Protection": "PAGE_EXECUTE_READWRITE", "CommitCharge": 2, "__children": []},
+    ]))
+    # Volatility 2 JSON layout.
+    (tmp_path / "psxview.json").write_text(json.dumps({
+        "columns": ["Offset(P)", "Name", "PID", "pslist", "psscan"],
+        "rows": [[1, "System", 4, True, True], [2, "evil.exe", 666, False, True],
+                 [3, "smss.exe", 300, True, True], [4, "csrss.exe", 400, True, True]],
+    }))
+    return tmp_path
+
+
+def test_aggregates_known_values(plugin_dir):
+    features = extract_memory_features(sorted(str(p) for p in plugin_dir.iterdir()), FEATURES, chunksize=2)
+
+    assert features['pslist.nproc'] == 3.0
+    assert features['pslist.nppid'] == 3.0
+    assert features['pslist.avg_threads'] == pytest.approx(37.0)
+    assert features['pslist.avg_handlers'] == pytest.approx(310.0)
+
+    # Per-process averages divide by the distinct PIDs seen in that plugin's own output.
+    assert features['dlllist.ndlls'] == 5.0
+    assert features['dlllist.avg_dlls_per_proc'] == pytest.approx(2.5)
+    assert features['handles.nhandles'] == 4.0
+    assert features['handles.avg_handles_per_proc'] == pytest.approx(2.0)
+    assert features['handles.nfile'] == 2.0
+    assert features['handles.nmutant'] == 1.0
+
+    # *_avg ratios are counts over the plugin's row count.
+    assert features['ldrmodules.not_in_load'] == 1.0
+    assert features['ldrmodules.not_in_load_avg'] == pytest.approx(0.25)
+    assert features['ldrmodules.not_in_mem_avg'] == pytest.approx(0.25)
+    assert features['psxview.not_in_pslist'] == 1.0
+    assert features['psxview.not_in_pslist_false_avg'] == pytest.approx(0.25)
+
+    # Matches the MalMem scale (Ransomeware.csv: 3 injections -> protection 18).
+    assert features['malfind.ninjections'] == 3.0
+    assert features['malfind.commitCharge'] == 7.0
+    assert features['malfind.protection'] == 18.0
+    assert features['malfind.uniqueInjections'] == pytest.approx(1.5)
+
+
+def test_numeric_protection_codes_are_summed(tmp_path):
+    malfind = tmp_path / "malfind.csv"
+    malfind.write_text("PID,Protection,CommitCharge\n10,6,1\n10,4,1\n11,PAGE_EXECUTE_READ,1\n")
+    features = extract_memory_features([str(malfind)], FEATURES)
+    assert features['malfind.protection'] == 13.0
+    assert features['malfind.uniqueInjections'] == pytest.approx(1.5)
+
+
+def test_vol2_svcscan_service_types(tmp_path):
+    svcscan = tmp_path / "svcscan.json"
+    svcscan.write_text(json.dumps({
+        "columns": ["Offset", "Order", "Start", "Pid", "ServiceName", "DisplayName", "ServiceType", "State", "BinaryPath"],
+        "rows": [
+            [1, 1, "SERVICE_BOOT_START", None, "ACPI", "ACPI", "SERVICE_KERNEL_DRIVER", "SERVICE_RUNNING", "\\Driver\\ACPI"],
+            [2, 2, "SERVICE_BOOT_START", None, "Ntfs", "Ntfs", "SERVICE_FILE_SYSTEM_DRIVER", "SERVICE_RUNNING", "\\FileSystem\\Ntfs"],
+            [3, 3, "SERVICE_AUTO_START", 700, "Spooler", "Print Spooler", "SERVICE_WIN32_OWN_PROCESS|SERVICE_INTERACTIVE_PROCESS", "SERVICE_RUNNING", "spoolsv.exe"],
+            [4, 4, "SERVICE_DEMAND_START", None, "W32Time", "Windows Time", "SERVICE_WIN32_SHARE_PROCESS", "SERVICE_STOPPED", "svchost.exe -k LocalService"],
+        ],
+    }))
+    features = extract_memory_features([str(svcscan)], FEATURES + [
+        'svcscan.nservices', 'svcscan.nactive', 'svcscan.kernel_drivers', 'svcscan.fs_drivers',
+        'svcscan.process_services', 'svcscan.shared_process_services', 'svcscan.interactive_process_services',
+    ])
+    assert features['svcscan.nservices'] == 4.0
+    assert features['svcscan.nactive'] == 3.0
+    assert features['svcscan.kernel_drivers'] == 1.0
+    assert features['svcscan.fs_drivers'] == 1.0
+    assert features['svcscan.process_services'] == 1.0
+    assert features['svcscan.shared_process_services'] == 1.0
+    assert features['svcscan.interactive_process_services'] == 1.0
+
+
+def test_unparsable_plugin_file_raises(plugin_dir):
+    (plugin_dir / "handles.json").write_text("{not json")
+    with pytest.raises(MemoryFeatureError, match="handles"):
+        extract_memory_features([str(plugin_dir / "pslist.csv"), str(plugin_dir / "handles.json")], FEATURES)
+
+
+def test_unknown_and_duplicate_plugins_raise(tmp_path):
+    (tmp_path / "notes.csv").write_text("a\n1\n")
+    with pytest.raises(MemoryFeatureError):
+        extract_memory_features([str(tmp_path / "notes.csv")], FEATURES)
+    with pytest.raises(MemoryFeatureError, match="More than one"):
+        extract_memory_features([str(tmp_path / "a.pslist.csv"), str(tmp_path / "b.pslist.csv")], FEATURES)
+
+
+def test_missing_plugins():
+    assert 'malfind' in missing_plugins(['pslist', 'handles'])
+    assert 'pslist' not in missing_plugins(['pslist', 'handles'])
@@ -0,0 +1,44 @@
+# tests/test_similarity_index.py
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("tensorflow")
+
+from similarity_index import ScanHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    return ScanHistory(str(tmp_path / "history.sqlite3"), dim=2, max_entries=3)
+
+
+def test_rescans_replace_without_evicting_other_scans(history):
+    for i in range(3):
+        history.add(f"hash{i}", [i, 0], "Benign", f"file{i}.exe", "t")
+    for _ in range(10):
+        history.add("hash0", [0, 0], "Trojan", "file0.exe", "t")
+
+    found = history.search([0, 0], k=10)
+    assert sorted(r['sha256'] for r in found) == ["hash0", "hash1", "hash2"]
+    assert [r['label'] for r in found if r['sha256'] == "hash0"] == ["Trojan"]
+
+
+def test_oldest_scans_are_evicted_beyond_max_entries(history):
+    for i in range(3):
+        history.add(f"hash{i}", [i, 0], "Benign", f"file{i}.exe", "t")
+    history.search([0, 0])  # Warm the cache before eviction.
+    history.add("hash1", [1, 0], "Benign", "file1.exe", "t")
+    history.add("hash3", [3, 0], "Benign", "file3.exe", "t")
+
+    found = history.search([0, 0], k=10)
+    assert sorted(r['sha256'] for r in found) == ["hash1", "hash2", "hash3"]
+
+
+def test_history_is_shared_and_excludes_the_current_scan(history, tmp_path):
+    history.add("hash0", [0, 0], "Benign", "file0.exe", "t")
+    other_worker = ScanHistory(str(tmp_path / "history.sqlite3"), dim=2, max_entries=3)
+    other_worker.add("hash1", [1, 0], "Benign", "file1.exe", "t")
+
+    assert [r['sha256'] for r in history.search(np.zeros(2), k=10, exclude_hash="hash0")] == ["hash1"]